@@ -0,0 +1,217 @@
+import os
+
+# Everything is drawn off screen: Agg for matplotlib and a GL backend that
+# accepts every call without a window, so this runs on a machine with no display
+os.environ.setdefault('KIVY_GL_BACKEND', 'mock')
+os.environ.setdefault('KIVY_NO_ARGS', '1')
+os.environ.setdefault('KIVY_NO_CONSOLELOG', '1')
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import random
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from Frame_Profiler import callback_name
+from Telemetry_Store import DATA_COLUMNS
+
+DATA_NAMES = [name for name, dtype in DATA_COLUMNS]
+
+DEFAULT_RATES = [1, 10, 100, 1000]
+
+
+def synthetic_rows(first, count, rate, start_time=1633423236):
+    from Descent_Profile import NOMINAL_PROFILE, altitude_at, landing_time
+
+    flight = landing_time(NOMINAL_PROFILE)
+    data_lines = []
+    altitude_lines = []
+    for i in range(first, first + count):
+        t = i / rate
+        altitude = altitude_at(NOMINAL_PROFILE, t % flight) + random.gauss(0, 2)
+        fields = [
+            f"{start_time + t:.3f}", str(i), f"{altitude:.1f}",
+            f"{1010 + random.gauss(0, 0.5):.1f}", f"{12.5 + random.gauss(0, 0.1):.2f}", str(int(t)),
+            f"{101.3 - altitude * 0.012:.2f}",
+            f"{35.789764 + t * 1e-5:.6f}", f"{-121.456789 + t * 1e-5:.6f}", f"{altitude + random.gauss(0, 5):.1f}",
+            str(random.randint(4, 12)), f"{random.gauss(0, 0.2):.2f}", f"{random.gauss(0, 0.05):.4f}",
+            str(1 if altitude > 500 else 2), f"{random.uniform(0, 5):.2f}", f"{random.uniform(0, 11):.3f}",
+            f"{random.uniform(0.1, 0.6):.3f}", f"{random.uniform(0, 0.3):.3f}",
+        ]
+        # DATA.csv lines end in a comma, keep that so the parser sees the real format
+        data_lines.append(','.join(fields) + ',\n')
+        altitude_lines.append(f"{i},{altitude:.1f}\n")
+    return data_lines, altitude_lines
+
+
+def write_headers(data_path, altitude_path):
+    with open(data_path, 'w') as f:
+        f.write(','.join(DATA_NAMES) + ',\n')
+    with open(altitude_path, 'w') as f:
+        f.write('PACKET_COUNT,ALTITUDE\n')
+
+
+def append_rows(data_path, altitude_path, first, count, rate):
+    data_lines, altitude_lines = synthetic_rows(first, count, rate)
+    with open(data_path, 'a') as f:
+        f.writelines(data_lines)
+    with open(altitude_path, 'a') as f:
+        f.writelines(altitude_lines)
+
+
+def percentiles(samples):
+    import numpy as np
+
+    if not samples:
+        return {}
+    values = np.array(samples) * 1000
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {'p50': p50, 'p95': p95, 'p99': p99, 'max': values.max(), 'calls': len(samples)}
+
+
+def bulk_ingest(directory, rate, size_mb):
+    from Packet_Validator import PacketValidator
+    from Telemetry_Feed import TelemetryFeed
+    from Telemetry_Store import TelemetryStore, ALTITUDE_COLUMNS, VALIDATED_COLUMNS
+
+    data_path = os.path.join(directory, 'bulk DATA.csv')
+    altitude_path = os.path.join(directory, 'bulk Altitude.csv')
+    write_headers(data_path, altitude_path)
+    sample, _ = synthetic_rows(0, 100, rate)
+    rows = int(size_mb * 1e6 * len(sample) / sum(len(line) for line in sample))
+    append_rows(data_path, altitude_path, 0, rows, rate)
+    size = os.path.getsize(data_path) + os.path.getsize(altitude_path)
+
+    feed = TelemetryFeed({'DATA': data_path, 'ALTITUDE': altitude_path})
+    store = TelemetryStore(VALIDATED_COLUMNS)
+    altitude_store = TelemetryStore(ALTITUDE_COLUMNS)
+    feed.subscribe('DATA', PacketValidator(store).extend)
+    feed.subscribe('ALTITUDE', altitude_store.extend)
+
+    begin = time.perf_counter()
+    feed.poll()
+    took = time.perf_counter() - begin
+    return {'rows': rows, 'bytes': size, 'seconds': took, 'rows_per_second': rows / took, 'mb_per_second': size / 1e6 / took}
+
+
+def live_frames(directory, rate, duration, fps, size, renderer='matplotlib'):
+    from Finalapp import CombinedApp, LiveUpdateApp, MapApp, AltitudeApp
+    from Flight_Recorder import FlightRecorder
+    from Render_Scheduler import RenderScheduler
+    from Telemetry_Feed import TelemetryFeed
+
+    data_path = os.path.join(directory, 'DATA.csv')
+    altitude_path = os.path.join(directory, 'Altitude.csv')
+    write_headers(data_path, altitude_path)
+
+    # The same objects CombinedApp.build wires together, minus the window
+    app = CombinedApp(renderer=renderer)
+    app.wire_stream(TelemetryFeed({'DATA': data_path, 'ALTITUDE': altitude_path}),
+                    FlightRecorder(os.path.join(directory, 'Telemetry data.csv'), os.path.join(directory, 'Telemetry data.npz')))
+    app.scheduler = RenderScheduler(app.feed, fps)
+
+    graphs = app.build_graphs()
+    graphs.size = size
+    for row in graphs.children:
+        row.size = size[0], size[1] / 2
+        for graph in row.children:
+            graph.size = size[0] / 3, size[1] / 2
+    LiveUpdateApp(app.feed, app.store, app.scheduler, app.recorder, validator=app.validator, metrics=app.metrics).build()
+    AltitudeApp(app.altitude_store, app.scheduler, app.metrics, app.predictor).build().size = size
+    # The map itself needs tiles from the network, only its data path is measured
+    map_app = MapApp(app.store, app.scheduler)
+    app.scheduler.add(lambda dt: map_app.get_latest_position(), interval=1)['name'] = 'MapApp.get_latest_position'
+
+    # Simulated time: packets arrive as if at the given rate and every frame runs
+    # straight after the previous one, so the run takes as long as the work does
+    for entry in app.scheduler.entries:
+        entry['last'] = 0.0
+    frame_times = []
+    timings = {'poll': []}
+    written = 0
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for frame in range(int(duration * fps)):
+            now = (frame + 1) / fps
+            due = int(now * rate)
+            if due > written:
+                append_rows(data_path, altitude_path, written, due - written, rate)
+                written = due
+
+            begin = time.perf_counter()
+            app.feed.poll()
+            timings['poll'].append(time.perf_counter() - begin)
+            for entry in app.scheduler.entries:
+                elapsed = now - entry['last']
+                if elapsed < entry['interval']:
+                    continue
+                entry['last'] = now
+                start = time.perf_counter()
+                entry['callback'](elapsed)
+                timings.setdefault(callback_name(entry), []).append(time.perf_counter() - start)
+            frame_times.append(time.perf_counter() - begin)
+    app.recorder.close()
+
+    return {
+        'packets': written,
+        'frames': percentiles(frame_times),
+        'overruns': sum(1 for took in frame_times if took > 1.0 / fps),
+        'callbacks': {name: percentiles(samples) for name, samples in timings.items()},
+    }
+
+
+def run_rate(rate, duration, fps, size_mb, size, renderer='matplotlib'):
+    with tempfile.TemporaryDirectory() as directory:
+        result = {'rate': rate}
+        result['ingest'] = bulk_ingest(directory, rate, size_mb)
+        result['live'] = live_frames(directory, rate, duration, fps, size, renderer)
+    # ru_maxrss is in kilobytes on Linux; each rate runs in its own process so this is its own peak
+    result['peak_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return result
+
+
+def report(result, fps):
+    ingest = result['ingest']
+    live = result['live']
+    frames = live['frames']
+    print(f"{result['rate']:g} Hz")
+    print(f"  ingest    {ingest['rows']} rows, {ingest['bytes'] / 1e6:.1f} MB in {ingest['seconds']:.2f} s"
+          f" = {ingest['rows_per_second']:,.0f} rows/s, {ingest['mb_per_second']:.1f} MB/s")
+    print(f"  frames    {frames['calls']} frames, {live['packets']} packets, p50 {frames['p50']:.2f} ms"
+          f"  p95 {frames['p95']:.2f} ms  p99 {frames['p99']:.2f} ms  max {frames['max']:.2f} ms"
+          f"  ({live['overruns']} over {1000 / fps:.0f} ms)")
+    for name, stats in live['callbacks'].items():
+        print(f"  {name:<30}{stats['calls']:7d} calls  p50 {stats['p50']:8.2f} ms  p95 {stats['p95']:8.2f} ms  p99 {stats['p99']:8.2f} ms")
+    print(f"  peak memory {result['peak_mb']:.0f} MB")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Headless ground station benchmark on synthetic telemetry')
+    parser.add_argument('--rates', type=float, nargs='+', default=DEFAULT_RATES, help='packet rates to run, in Hz')
+    parser.add_argument('--duration', type=float, default=60, help='seconds of flight to simulate at each rate')
+    parser.add_argument('--size-mb', type=float, default=10, help='size of the file read in one go for the ingest throughput')
+    parser.add_argument('--fps', type=int, default=20, help='frames per simulated second, as Finalapp --fps')
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--renderer', choices=['matplotlib', 'kivy'], default='matplotlib', help='as Finalapp --renderer')
+    parser.add_argument('--output', metavar='FILE', help='also write the results as JSON, to compare runs')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    results = []
+    for rate in args.rates:
+        # A fresh process per rate, so the peak memory of one run doesn't hide the next
+        with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as executor:
+            result = executor.submit(run_rate, rate, args.duration, args.fps, args.size_mb, (args.width, args.height), args.renderer).result()
+        report(result, args.fps)
+        results.append(result)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, default=float)
@@ -0,0 +1,55 @@
+import queue
+import sys
+import threading
+import time
+
+
+class ConsoleLog:
+    # print() blocks the UI thread whenever the terminal is slow to scroll. Messages
+    # are queued instead and written by a thread, at most rate per second on
+    # average with bursts of up to burst; the rest are counted and reported as skipped
+    def __init__(self, rate=10, burst=50, stream=None):
+        self.rate = rate
+        self.burst = burst
+        self.stream = stream
+        self.tokens = burst
+        self.last = time.monotonic()
+        self.skipped = 0
+        self.queue = queue.SimpleQueue()
+        self.thread = None
+
+    def log(self, message):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens < 1:
+            self.skipped += 1
+            return
+        self.tokens -= 1
+        if self.skipped:
+            message = f"({self.skipped} messages skipped)\n{message}"
+            self.skipped = 0
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='ConsoleLog', daemon=True)
+            self.thread.start()
+        self.queue.put(message)
+
+    def run(self):
+        while True:
+            message = self.queue.get()
+            if message is None:
+                break
+            stream = self.stream or sys.stdout
+            stream.write(f"{message}\n")
+            stream.flush()
+
+    def close(self):
+        # Writes out whatever is still queued, for on_stop
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join(timeout=1)
+        self.thread = None
+
+
+console = ConsoleLog()
@@ -0,0 +1,44 @@
+import time
+from functools import lru_cache
+
+import numpy as np
+
+LINE_COLOR = '#1db954'
+
+
+@lru_cache(maxsize=4096)
+def time_label(t):
+    return time.strftime("%H:%M:%S", time.localtime(t))
+
+
+def visible_range(x, x_min, x_max):
+    # x is packet time, so it is sorted and the visible part is found by bisection.
+    # One point either side is kept so the line still runs to the axes edges
+    start = max(np.searchsorted(x, x_min, side='left') - 1, 0)
+    stop = min(np.searchsorted(x, x_max, side='right') + 1, len(x))
+    return start, stop
+
+
+def minmax_decimate(x, y, buckets):
+    # Keeps the lowest and highest sample of every bucket, in time order, so a
+    # one-packet spike still shows up however many packets share a pixel
+    n = len(x)
+    if buckets < 1 or n <= 2 * buckets:
+        return x, y
+
+    size = n // buckets
+    head = n - size * buckets
+    grouped = y[head:].reshape(buckets, size)
+    low = grouped.argmin(axis=1)
+    high = grouped.argmax(axis=1)
+    base = np.arange(buckets) * size + head
+
+    # The first and last samples are always kept so the line spans the same range,
+    # and the few before the first whole bucket keep their extremes too
+    index = np.zeros(2 * buckets + 4, dtype=np.intp)
+    if head:
+        index[1:3] = sorted((int(y[:head].argmin()), int(y[:head].argmax())))
+    index[3:-1:2] = np.minimum(low, high) + base
+    index[4:-1:2] = np.maximum(low, high) + base
+    index[-1] = n - 1
+    return x[index], y[index]
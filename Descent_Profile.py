@@ -0,0 +1,62 @@
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+
+# A two-stage descent: free fall from apogee at first_rate (m/s) until the
+# parachute opens at deploy_altitude, then down to the ground at second_rate
+DescentProfile = namedtuple('DescentProfile', ['apogee', 'deploy_altitude', 'first_rate', 'second_rate'])
+
+NOMINAL_PROFILE = DescentProfile(900, 500, 400 / 21.413, 500 / 249.653)
+SLOW_PROFILE = DescentProfile(900, 500, 400 / 28.079, 500 / 498.576)
+FAST_PROFILE = DescentProfile(900, 500, 400 / 17.413, 500 / 166.353)
+
+
+def deploy_time(profile):
+    return (profile.apogee - profile.deploy_altitude) / profile.first_rate
+
+
+def landing_time(profile):
+    return deploy_time(profile) + profile.deploy_altitude / profile.second_rate
+
+
+def altitude_at(profile, t):
+    # Scalar version for checking one sample at a time
+    t_deploy = deploy_time(profile)
+    if t <= t_deploy:
+        altitude = profile.apogee - profile.first_rate * t
+    else:
+        altitude = profile.deploy_altitude - profile.second_rate * (t - t_deploy)
+    return max(altitude, 0.0)
+
+
+def altitudes(profile, t):
+    t_deploy = deploy_time(profile)
+    altitude = np.where(t <= t_deploy,
+                        profile.apogee - profile.first_rate * t,
+                        profile.deploy_altitude - profile.second_rate * (t - t_deploy))
+    return np.maximum(altitude, 0.0)
+
+
+@lru_cache(maxsize=32)
+def descent_curve(profile, points=50):
+    t = np.linspace(0, landing_time(profile), points)
+    altitude = altitudes(profile, t)
+    # Shared between callers through the cache, so nobody may modify them
+    t.flags.writeable = False
+    altitude.flags.writeable = False
+    return t, altitude
+
+
+class DescentEnvelope:
+    def __init__(self, nominal=NOMINAL_PROFILE, slow=SLOW_PROFILE, fast=FAST_PROFILE):
+        self.nominal = nominal
+        self.slow = slow
+        self.fast = fast
+
+    def check(self, t, altitude):
+        # Returns the deviation from the nominal descent and whether the sample
+        # lies between the fast (lowest) and slow (highest) descents
+        deviation = altitude - altitude_at(self.nominal, t)
+        inside = altitude_at(self.fast, t) <= altitude <= altitude_at(self.slow, t)
+        return deviation, inside
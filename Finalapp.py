@@ -1,96 +1,50 @@
-import pandas as pd
+from Startup_Timer import startup_timer
+import argparse
 from kivy.app import App
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.label import Label
 from kivy.uix.button import Button
-from kivy.clock import Clock
 import datetime
+import time
 from kivy.uix.tabbedpanel import TabbedPanel, TabbedPanelItem
-from kivy.garden.matplotlib import FigureCanvasKivyAgg
-import matplotlib.pyplot as plt
-from matplotlib.animation import FuncAnimation
-from kivy.uix.popup import Popup
-from kivy.garden.mapview import MapView, MapMarker
 from kivy.uix.floatlayout import FloatLayout
-import numpy as np
-
-class GraphWidget(FigureCanvasKivyAgg):
-    def __init__(self, column_name, y_limits, **kwargs):
-        self.fig, self.ax = plt.subplots()
-        self.line, = self.ax.plot([], [], linestyle='-', linewidth=3, marker='o', color='#1db954')
-
-        self.ax.set_xlim(datetime.datetime.now(), datetime.datetime.now())
-        self.ax.set_ylim(*y_limits)
-
-        self.fig.set_facecolor('black')
-        self.ax.set_facecolor('black')
-        self.ax.tick_params(axis='x', colors='white')
-        self.ax.tick_params(axis='y', colors='white')
-        self.ax.set_title(column_name, color='white')
-        self.ax.spines['bottom'].set_color('white')
-        self.ax.spines['left'].set_color('white')
-
-        data = pd.read_csv("DATA.csv")
-        y_values = data[column_name]
-
-        self.x_data = []
-        self.y_data = []
-
-        def update(frame):
-            now = datetime.datetime.now()
-            x_str = now.strftime("%H:%M:%S")
-            x = datetime.datetime.strptime(x_str, "%H:%M:%S")
-            y = y_values[frame]
-            self.x_data.append(x)
-            self.y_data.append(y)
-
-            self.line.set_data(self.x_data, self.y_data)
-
-            if len(self.x_data) > 8:
-                self.ax.set_xlim(self.x_data[-8], self.x_data[-1])
-                self.ax.set_xticks(self.x_data[-8:])
-                self.ax.set_xticklabels([dt.strftime("%H:%M:%S") for dt in self.x_data[-8:]], rotation=30, ha='right')
-            else:
-                self.ax.set_xlim(min(self.x_data), max(self.x_data))
-                self.ax.set_xticklabels([dt.strftime("%H:%M:%S") for dt in self.x_data[-8:]], rotation=30, ha='right')
-
-            return self.line,
-
-        animation = FuncAnimation(self.fig, update, frames=len(y_values), interval=1000)
-
-        super().__init__(self.fig)
+from Telemetry_Feed import TelemetryFeed
+from Render_Scheduler import RenderScheduler
+from Source_Options import add_source_arguments, make_source, make_streams, make_validation
+from Console_Log import console
 
-        self.animation_running = True
-        self.animation = animation
-        self.animation._start()
+ALL_STREAMS = 'All streams'
 
-    def on_animation_progress(self, progress):
-        current_index = int(progress * len(self.y_data))
-        if current_index < len(self.y_data):
-            self.ax.lines.pop(0)
-            self.ax.add_line(self.line)
-            self.fig.canvas.draw()
-        else:
-            self.animation_running = False
-
-class GraphPopup(Popup):
-    def __init__(self, column_name, y_limits, **kwargs):
-        super().__init__(**kwargs)
-        graph_widget = GraphWidget(column_name, y_limits)
-        self.add_widget(graph_widget)
+# numpy is imported in build() for the store, validator and recorder; matplotlib
+# and mapview are imported by the tabs that use them, which are built after the
+# window has drawn
+startup_timer.mark('imports')
 
 class LiveUpdateApp(App):
-    def __init__(self, **kwargs):
+    def __init__(self, feed, store, scheduler, recorder, latency=None, streams=None, stream_spinner=None, validator=None, metrics=None, **kwargs):
         super().__init__(**kwargs)
+        self.feed = feed
+        self.store = store
+        self.scheduler = scheduler
+        self.recorder = recorder
+        self.latency = latency
+        self.streams = streams
+        self.stream_spinner = stream_spinner
+        self.validator = validator
+        self.metrics = metrics
         self.column_labels = {}
+        self.metric_labels = {}
         self.time_label = None
         self.date_label = None
-        self.recorded_data = []
+        self.packets_label = None
+        # (value, text, color) last shown per column, and the store and count it was read at
+        self.shown = {}
+        self.shown_store = None
+        self.shown_count = None
 
     def build(self):
-        data = pd.read_csv("DATA.csv")
-        data = data.dropna(axis=1)
-        column_names = data.columns.tolist()
+        # Before the first line of the file has arrived there is no header to go by
+        column_names = self.feed.columns('DATA') or self.current_store().columns
 
         num_columns = min(6, len(column_names))
         num_rows = (len(column_names) + num_columns - 1) // num_columns
@@ -102,8 +56,19 @@ class LiveUpdateApp(App):
         self.time_label = Label(text='', font_size='18sp')
         datetime_layout.add_widget(self.date_label)
         datetime_layout.add_widget(self.time_label)
+        self.packets_label = Label(text='', font_size='14sp')
+        datetime_layout.add_widget(self.packets_label)
+        if self.streams is not None:
+            datetime_layout.add_widget(self.stream_spinner())
         layout.add_widget(datetime_layout)
 
+        for names in (('descent', 'apogee', 'state'), tuple(self.current_metrics().smoothed)):
+            metrics_layout = BoxLayout(orientation='horizontal', spacing=10, size_hint=(1, 0.04))
+            for name in names:
+                self.metric_labels[name] = Label(text='', font_size='15sp', color=(0, 0.8, 1, 1))
+                metrics_layout.add_widget(self.metric_labels[name])
+            layout.add_widget(metrics_layout)
+
         data_layout = BoxLayout(orientation='vertical', spacing=5, size_hint=(1, 0.95))
         for row in range(num_rows):
             row_layout = BoxLayout(orientation='horizontal', spacing=2)
@@ -120,49 +85,450 @@ class LiveUpdateApp(App):
             data_layout.add_widget(row_layout)
         layout.add_widget(data_layout)
 
-        generate_button = Button(text="Generate csv file", size_hint=(1, None), height=50, color = (1,1,1,1), background_color = (0,0.5,0.9,1))
+        button_layout = BoxLayout(orientation='horizontal', spacing=2, size_hint=(1, None), height=50)
+        generate_button = Button(text="Generate csv file", color = (1,1,1,1), background_color = (0,0.5,0.9,1))
         generate_button.bind(on_press=self.generate_csv)
-        layout.add_widget(generate_button)
+        button_layout.add_widget(generate_button)
+        export_button = Button(text="Export compressed (.npz)", size_hint=(0.4, 1), color = (1,1,1,1), background_color = (0,0.5,0.9,1))
+        export_button.bind(on_press=self.export_columns)
+        button_layout.add_widget(export_button)
+        layout.add_widget(button_layout)
 
-        Clock.schedule_interval(self.update_data, 1.2)
+        self.scheduler.add(self.update_data, interval=0.1, widget=layout)
 
         return layout
 
     def update_data(self, dt):
-        data = pd.read_csv("DATA.csv")
-        data = data.dropna(axis=1)
-
+        # Labels are only given new text when what they show has changed, all
+        # together at the end, so Kivy only re-renders the textures that changed
         current_datetime = datetime.datetime.now()
-        current_date = current_datetime.strftime("%d-%b-%Y")
-        current_time = current_datetime.strftime("%I:%M:%S %p")
-        self.date_label.text = current_date
-        self.time_label.text = current_time
-
-        for column in self.column_labels:
-            if column in data.columns:
-                self.column_labels[column].text = str(data[column].iloc[-1])
-                print(data[column].iloc[-1])
-            else:
-                self.column_labels[column].text = ''
-        
-        current_data = {column: label.text for column, label in self.column_labels.items()}
-        self.recorded_data.append(current_data)
+        changes = [(self.date_label, current_datetime.strftime("%d-%b-%Y"), None),
+                   (self.time_label, current_datetime.strftime("%I:%M:%S %p"), None)]
+
+        store = self.current_store()
+        validator = self.current_validator()
+        if store is not self.shown_store or (store.count, len(store)) != self.shown_count:
+            self.shown_store = store
+            self.shown_count = (store.count, len(store))
+            changed = []
+            for column, label in self.column_labels.items():
+                value = store.latest(column) if column in store.arrays else None
+                shown = self.shown.get(column)
+                if shown is not None and value == shown[0]:
+                    continue
+                if value is None:
+                    text, color = '', None
+                else:
+                    text = f"{value:.10g}"
+                    low, high = validator.ranges.get(column, (value, value))
+                    # Out of range values are kept unless --reject-out-of-range, show them in red
+                    color = (1, 0, 0, 1) if not low <= value <= high else (0, 1, 0, 0.9)
+                    changed.append(f"{column}={text}")
+                self.shown[column] = (value, text, color)
+                changes.append((label, text, color))
+            changes.append((self.packets_label, validator.summary(), None))
+            self.update_metrics(self.current_metrics(), changes)
+            if changed:
+                console.log(' '.join(changed))
+
+        for label, text, color in changes:
+            if label.text != text:
+                label.text = text
+            if color is not None and label.color != color:
+                label.color = color
+        if self.latency is not None:
+            # The labels only ever show the newest packet
+            self.latency.mark('shown', self.store.count, self.store.count - 1)
+
+    def current_store(self):
+        # With several streams the labels show the selected one, or the first when all are overlaid
+        if self.streams is None:
+            return self.store
+        return self.streams.current()[1]
+
+    def update_metrics(self, metrics, changes):
+        labels = self.metric_labels
+        if metrics.descent_rate is not None:
+            changes.append((labels['descent'], f"Descent {metrics.descent_rate:.1f} m/s", None))
+        if metrics.apogee is not None:
+            changes.append((labels['apogee'], f"Apogee {metrics.apogee[2]:.1f} m", None))
+        elif metrics.peak is not None:
+            changes.append((labels['apogee'], f"Highest {metrics.peak[2]:.1f} m", None))
+        if metrics.state is not None:
+            since = metrics.state_since()
+            changes.append((labels['state'], f"FSW_STATE {metrics.state}" + (
+                f" since {datetime.datetime.fromtimestamp(since):%H:%M:%S}" if since is not None else ''), None))
+        for name, value in metrics.smoothed.items():
+            if value is not None:
+                extremes = metrics.extremes[name]
+                changes.append((labels[name], f"{name} {value:.4g} ({extremes.min():.4g} to {extremes.max():.4g})", None))
+
+    def current_metrics(self):
+        if self.streams is None:
+            return self.metrics
+        return self.streams.metrics[self.streams.current()[0]]
+
+    def current_validator(self):
+        if self.streams is None:
+            return self.validator
+        return self.streams.validators[self.streams.current()[0]]
 
     def generate_csv(self, instance):
-        if not self.recorded_data:
+        if not self.recorder.recorded:
             print("No data recorded yet. Generate some data first!")
             return
 
-        df = pd.DataFrame(self.recorded_data)
-        df.to_csv("Telemetry data.csv", index=False)
-        print("CSV file 'Telemetry data.csv' created successfully!")
+        # The recorder has been writing the file all along, it only needs flushing
+        self.recorder.flush()
+        print(f"CSV file '{self.recorder.path}' created successfully!")
+
+    def export_columns(self, instance):
+        store = self.current_store()
+        if not len(store):
+            print("No data recorded yet. Generate some data first!")
+            return
+
+        path = self.recorder.export_columns(store)
+        print(f"Writing the {len(store)} packets still in the store to '{path}', the whole flight is in '{self.recorder.path}'")
 
 class CombinedApp(App):
+    def __init__(self, source=None, max_fps=20, latency_file=None, latency_overlay=False, streams=None, validation=None,
+                 journal_file=None, journal_sync=1.0, renderer='matplotlib', profile=False, profile_stacks=False, **kwargs):
+        super().__init__(**kwargs)
+        self.source = source
+        self.streams = streams
+        self.validation = validation or {}
+        self.validator = None
+        self.metrics = None
+        self.predictor = None
+        self.history = None
+        self.stream_spinners = []
+        self.max_fps = max_fps
+        self.latency_file = latency_file
+        self.latency_overlay = latency_overlay
+        self.latency = None
+        self.journal_file = journal_file
+        self.journal_sync = journal_sync
+        self.journal = None
+        # 'kivy' draws the Graphs tab with Kivy canvas instructions instead of matplotlib
+        self.renderer = renderer
+        # Start with the frame profiler on, and with it sampling stacks on overruns
+        self.profile = profile
+        self.profile_stacks = profile_stacks
+        self.seeking = False
+
     def build(self):
+        from Flight_Recorder import FlightRecorder
+
+        if self.streams is not None:
+            # Each stream is parsed in a worker process straight into its own store;
+            # the Trajectory tab follows the first stream
+            self.feed = self.streams
+            self.store = self.streams.current()[1]
+            self.altitude_store = self.store
+            self.metrics = self.streams.metrics[self.streams.names[0]]
+            self.predictor = self.streams.predictors[self.streams.names[0]]
+            if hasattr(self.feed, 'recorder'):
+                # The ingest process records the packets as they were received
+                self.recorder = self.feed.recorder
+            else:
+                self.recorder = FlightRecorder(streams=True)
+                self.feed.subscribe(self.recorder.record_stream)
+            if self.latency_file or self.latency_overlay:
+                print("Error: packet latency is only tracked with a single stream")
+                self.latency_file = None
+                self.latency_overlay = False
+            if self.journal_file:
+                print("Error: the flight journal is only kept with a single stream")
+        else:
+            feed = self.source or TelemetryFeed()
+            # csv files are read again from the checkpoint's offsets; packets from a radio
+            # after the checkpoint are only in the journal and the recording, so they stay
+            reread = hasattr(feed, 'tailers')
+            resumed = None
+            if self.journal_file and hasattr(feed, 'seek'):
+                print("Error: a replay is already on disk, the flight journal is not kept")
+            elif self.journal_file:
+                from Flight_Journal import FlightJournal
+                self.journal = FlightJournal(self.journal_file, self.journal_sync)
+                resumed = self.journal.load(reread)
+            if resumed is not None and 'recording' in resumed[0]:
+                # After a crash the recording carries on in the same file
+                path, rows = resumed[0]['recording']
+                self.wire_stream(feed, FlightRecorder(path, append=True, keep=rows if reread else None))
+            else:
+                self.wire_stream(feed, FlightRecorder())
+            if self.journal is not None:
+                if resumed is not None:
+                    self.resume(*resumed)
+                self.journal.start()
+                self.validator.subscribe(lambda count, columns: self.journal.record('DATA', count, columns))
+                self.feed.subscribe('ALTITUDE', lambda rows: self.journal.record_rows('ALTITUDE', rows))
+        if self.latency_file or self.latency_overlay:
+            from Packet_Latency import LatencyTracker
+            self.latency = LatencyTracker(self.feed, count=self.store.count)
+            self.validator.subscribe(self.latency.record)
+        self.feed.poll()
+        if self.store.count:
+            startup_timer.mark('first packet')
+        # One frame callback polls the feed once and then updates every visible widget
+        self.scheduler = RenderScheduler(self.feed, self.max_fps)
+        if self.journal is not None:
+            # Between polls, so the offsets and the records handed over match
+            self.scheduler.add(lambda dt: self.journal.checkpoint(self.journal_state()), interval=self.journal_sync)['name'] = 'FlightJournal.checkpoint'
+        if self.profile or self.profile_stacks:
+            self.set_profiling(True)
         tabbed_panel = TabbedPanel()
 
-        tab_graphs = TabbedPanelItem(text='Graphs')
+        # Tabs are built the first time they are selected; the scheduler skips
+        # widgets that are off screen, so hidden tabs cost nothing until reopened
+        self.tab_builders = {}
+        tabs = []
+        for text, builder in (('Graphs', self.build_graphs),
+                              ('Live Update', self.build_live_update),
+                              ('Map', self.build_map),
+                              ('Trajectory', self.build_trajectory)):
+            tab = TabbedPanelItem(text=text)
+            self.tab_builders[tab] = builder
+            tabbed_panel.add_widget(tab)
+            tabs.append(tab)
+
+        tabbed_panel.bind(current_tab=self.on_tab_selected)
+        tabbed_panel.default_tab = tabs[0]
+
+        self.scheduler.start()
+        startup_timer.mark('build()')
+
+        if self.streams is None and hasattr(self.feed, 'seek'):
+            # Above the tabs: the matplotlib canvases only follow a change of size, not of position
+            root = BoxLayout(orientation='vertical')
+            root.add_widget(self.build_replay_bar(self.feed))
+            root.add_widget(tabbed_panel)
+            self.feed.subscribe_seek(self.on_replay_seek)
+            return root
+        return tabbed_panel
+
+    def on_start(self):
+        from kivy.core.window import Window
+
+        Window.bind(on_flip=self.on_first_frame)
+        Window.bind(on_key_down=self.on_key_down)
+        if self.streams is not None:
+            self.streams.subscribe(lambda name, count, columns: self.on_first_packet(None))
+        elif not self.store.count:
+            self.feed.subscribe('DATA', self.on_first_packet)
+        if self.latency_overlay:
+            self.show_latency_overlay(Window)
+
+    def on_key_down(self, window, key, scancode, codepoint, modifiers):
+        # F12 turns the frame profiler on and off, shift+F12 its stack samples on overruns
+        if key != 293:
+            return False
+        if 'shift' in modifiers:
+            self.profile_stacks = not self.profile_stacks
+            if self.scheduler.profiler is None:
+                self.set_profiling(True)
+            else:
+                self.scheduler.profiler.set_stacks(self.profile_stacks)
+                console.log(f"Frame profiler stack samples {'on' if self.profile_stacks else 'off'}")
+        else:
+            self.set_profiling(self.scheduler.profiler is None)
+        return True
+
+    def set_profiling(self, enabled):
+        from Frame_Profiler import FrameProfiler
+
+        if enabled:
+            self.scheduler.profile(FrameProfiler(self.scheduler.frame_time, stacks=self.profile_stacks))
+            console.log(f"Frame profiler on{', sampling stacks on overruns' if self.profile_stacks else ''}")
+        else:
+            self.scheduler.profile(None)
+            console.log("Frame profiler off")
+
+    def on_first_frame(self, window):
+        window.unbind(on_flip=self.on_first_frame)
+        startup_timer.mark('first frame')
+        startup_timer.report()
+
+    def on_first_packet(self, rows):
+        if 'first packet' not in startup_timer.names():
+            startup_timer.mark('first packet')
+            startup_timer.report_last()
+
+    def show_latency_overlay(self, window):
+        # Added to the window rather than a tab so it stays on top of every screen
+        overlay = Label(text='', font_size='14sp', font_name='RobotoMono-Regular', size_hint=(None, None),
+                        size=(260, 130), halign='left', valign='top', color=(1, 1, 0, 1))
+        overlay.text_size = overlay.size
+
+        def place(*args):
+            overlay.pos = (window.width - overlay.width, window.height - overlay.height - 50)
+
+        def update(dt):
+            overlay.text = self.latency.overlay_text()
+
+        window.bind(size=place)
+        place()
+        window.add_widget(overlay)
+        self.scheduler.add(update, interval=1, widget=overlay)
+
+    def stream_spinner(self):
+        from kivy.uix.spinner import Spinner
+
+        # Every tab has its own spinner but they all show and set the same choice
+        spinner = Spinner(text=self.streams.selected or ALL_STREAMS, values=[ALL_STREAMS] + self.streams.names,
+                          size_hint=(0.3, 1))
+        spinner.bind(text=self.on_stream_selected)
+        self.stream_spinners.append(spinner)
+        return spinner
+
+    def on_stream_selected(self, spinner, text):
+        self.streams.select(text)
+        for other in self.stream_spinners:
+            other.text = text
+
+    def build_replay_bar(self, replay):
+        from kivy.uix.slider import Slider
+        from kivy.uix.spinner import Spinner
+        from Flight_Replay import SPEEDS
+
+        bar = BoxLayout(orientation='horizontal', spacing=10, size_hint=(1, None), height=44)
+        play_button = Button(text='Pause', size_hint=(0.1, 1), background_color=(0, 0.5, 0.9, 1))
+        speed_spinner = Spinner(text=f"{replay.speed:g}x", values=[f"{speed}x" for speed in SPEEDS], size_hint=(0.1, 1))
+        slider = Slider(min=replay.first(), max=max(replay.last(), replay.first() + 1), value=replay.first(), size_hint=(0.6, 1))
+        time_label = Label(text='', size_hint=(0.2, 1))
+
+        def toggle(instance):
+            if replay.playing:
+                replay.pause()
+            else:
+                replay.play()
+            play_button.text = 'Pause' if replay.playing else 'Play'
+
+        def dragging(instance, touch):
+            # The slider stops following the replay while it is being dragged
+            if instance.collide_point(*touch.pos):
+                self.seeking = True
+
+        def released(instance, touch):
+            if self.seeking:
+                self.seeking = False
+                replay.seek(instance.value)
+
+        def update(dt):
+            flight_time = min(replay.now(), replay.last())
+            if not self.seeking:
+                slider.value = flight_time
+            play_button.text = 'Pause' if replay.playing else 'Play'
+            time_label.text = f"{datetime.datetime.fromtimestamp(flight_time):%H:%M:%S}  +{flight_time - replay.first():.0f} s"
+
+        play_button.bind(on_press=toggle)
+        speed_spinner.bind(text=lambda spinner, text: replay.set_speed(float(text.rstrip('x'))))
+        slider.bind(on_touch_down=dragging, on_touch_up=released)
+        for widget in (play_button, speed_spinner, slider, time_label):
+            bar.add_widget(widget)
+        self.scheduler.add(update, interval=0.25, widget=bar)
+        return bar
+
+    def wire_stream(self, feed, recorder):
+        # The single stream path, also what Benchmark.py measures
+        from Telemetry_Store import TelemetryStore, ALTITUDE_COLUMNS, VALIDATED_COLUMNS
+        from Packet_Validator import PacketValidator
+        from Multi_Stream import derive
+
+        self.feed = feed
+        self.store = TelemetryStore(VALIDATED_COLUMNS)
+        self.altitude_store = TelemetryStore(ALTITUDE_COLUMNS)
+        self.recorder = recorder
+        # Packets reach the store through the validator; the recorder keeps everything as received
+        self.validator = PacketValidator(self.store, **self.validation)
+        if self.validator.checksums:
+            feed.line_filter = self.validator.check_lines
+        feed.subscribe('DATA', self.validator.extend)
+        if not hasattr(feed, 'seek'):
+            # A replay is read from a recording already; it isn't recorded again
+            feed.subscribe('DATA', recorder.record)
+        # Descent rate, rolling stats, apogee and state changes, the landing fit and the
+        # whole flight for the graph popup, updated per batch for every tab to read
+        self.metrics, self.predictor, self.history = derive(self.validator)
+        feed.subscribe('ALTITUDE', self.altitude_store.extend)
+        if hasattr(feed, 'subscribe_reset'):
+            feed.subscribe_reset('DATA', self.on_source_reset)
+            feed.subscribe_reset('ALTITUDE', self.altitude_store.clear)
+
+    def resume(self, checkpoint, records):
+        # Back to the journal's last checkpoint: the stores take the newest records
+        # straight from the mapped files, everything derived comes from the checkpoint
+        began = time.perf_counter()
+        data = records['DATA']
+        for store, stored in ((self.store, data), (self.altitude_store, records['ALTITUDE'])):
+            tail = stored[max(0, len(stored) - store.capacity):]
+            store.extend_columns(len(stored), {name: tail[name] for name in tail.dtype.names})
+        if len(data):
+            self.history.update(len(data), {name: data[name] for name in data.dtype.names})
+        self.validator.restore(checkpoint['validator'], data['PACKET_COUNT'])
+        self.metrics.restore(checkpoint['metrics'])
+        self.predictor.restore(checkpoint['predictor'])
+        # Records kept past the checkpoint, from a source that can't be read again
+        extra = len(data) - checkpoint['records']['DATA']
+        if extra > 0:
+            columns = {name: data[name][-extra:] for name in data.dtype.names}
+            self.validator.restore_released(extra, columns)
+            self.metrics.update(extra, columns)
+            self.predictor.update(extra, columns)
+        for name, (offset, inode, header) in checkpoint['offsets'].items():
+            tailer = self.feed.tailers[name]
+            tailer.offset, tailer.inode, tailer.header = offset, inode, header
+        print(f"Resumed {len(data)} packets from '{self.journal_file}' in {(time.perf_counter() - began) * 1000:.0f} ms")
+
+    def journal_state(self):
+        # The rows handed over so far are on disk before the checkpoint counts them
+        self.recorder.sync()
+        offsets = {}
+        for name, tailer in getattr(self.feed, 'tailers', {}).items():
+            # A line the writer hasn't finished is read again after a restart
+            offsets[name] = [tailer.offset - len(tailer.partial), tailer.inode, tailer.header]
+        return {'offsets': offsets, 'recording': [self.recorder.path, self.recorder.handed], 'validator': self.validator.checkpoint(),
+                'metrics': self.metrics.checkpoint(), 'predictor': self.predictor.checkpoint()}
+
+    def on_replay_seek(self):
+        # The replay sends the packets leading up to the new position next; everything
+        # derived from the old position goes
+        for part in (self.store, self.altitude_store, self.validator, self.metrics, self.predictor, self.history):
+            part.clear()
+
+    def on_source_reset(self):
+        # DATA.csv was replaced or written again from the start, a new flight: the
+        # packets of the old one go, or the new counts would all look like repeats
+        console.log(f"DATA.csv started again, cleared {self.store.count - self.store.start} packets")
+        for part in (self.store, self.validator, self.metrics, self.predictor, self.history):
+            part.clear()
+
+    def on_tab_selected(self, tabbed_panel, tab):
+        builder = self.tab_builders.pop(tab, None)
+        if builder is not None:
+            # Built on the next frame: switch_to clears the panel after this handler
+            # returns, and the window gets to draw before the heavy imports run
+            self.scheduler.once(lambda: self.build_tab(tab, builder), f"CombinedApp.{builder.__name__}")
+
+    def build_tab(self, tab, builder):
+        with startup_timer.section(f'{tab.text} tab'):
+            content = builder()
+        tab.add_widget(content)
+        startup_timer.report_last()
+
+    def build_graphs(self):
+        if self.renderer == 'kivy':
+            from Kivy_Graph import KivyGraph as GraphWidget
+        else:
+            from Graph_Widget import GraphWidget
+
         graph_layout = BoxLayout(orientation='vertical', spacing=10)
+        if self.streams is not None:
+            stream_row = BoxLayout(orientation='horizontal', size_hint=(1, 0.06))
+            stream_row.add_widget(Label(text='Streams', size_hint=(0.7, 1)))
+            stream_row.add_widget(self.stream_spinner())
+            graph_layout.add_widget(stream_row)
 
         graph_specs = [
             {"column_name": "ALTITUDE", "y_limits": (100, 200)},
@@ -179,62 +545,113 @@ class CombinedApp(App):
             for spec in graph_specs[i:i+num_columns]:
                 column_name = spec["column_name"]
                 y_limits = spec["y_limits"]
-                graph_widget = GraphWidget(column_name, y_limits)
+                graph_widget = GraphWidget(column_name, y_limits, self.store, self.scheduler, latency=self.latency, streams=self.streams)
                 graph_widget.bind(on_touch_down=self.show_popup)
                 row_layout.add_widget(graph_widget)
             graph_layout.add_widget(row_layout)
 
-        tab_graphs.content = graph_layout
-
-        tab_live_update = TabbedPanelItem(text='Live Update')
-        live_update_app = LiveUpdateApp()
-        tab_live_update.add_widget(live_update_app.build())
-
-        tab_map = TabbedPanelItem(text='Map')
-        map_app = MapApp()
-        tab_map.add_widget(map_app.build())
-
-        tab_trajectory = TabbedPanelItem(text='Trajectory')
-        trajectory_app = AltitudeApp()
-        tab_trajectory.add_widget(trajectory_app.build())
-
-        tabbed_panel.add_widget(tab_graphs)
-        tabbed_panel.add_widget(tab_live_update)
-        tabbed_panel.add_widget(tab_map)
-        tabbed_panel.add_widget(tab_trajectory)
-
-        tabbed_panel.default_tab = tab_graphs
-
-        return tabbed_panel
+        return graph_layout
+
+    def build_live_update(self):
+        live_update_app = LiveUpdateApp(self.feed, self.store, self.scheduler, self.recorder, self.latency,
+                                        self.streams, self.stream_spinner, self.validator, self.metrics)
+        return live_update_app.build()
+
+    def build_map(self):
+        map_app = MapApp(self.store, self.scheduler, self.streams, self.predictor)
+        return map_app.build()
+
+    def build_trajectory(self):
+        trajectory_app = AltitudeApp(self.altitude_store, self.scheduler, self.metrics, self.predictor)
+        return trajectory_app.build()
+
+    def on_stop(self):
+        self.scheduler.stop()
+        # The last report goes out before the console is closed
+        self.scheduler.profile(None)
+        self.recorder.close()
+        if self.source is not None:
+            self.source.stop()
+        if self.streams is not None:
+            self.streams.stop()
+        if self.validator is not None:
+            print(self.validator.summary())
+        if self.latency_file:
+            self.latency.dump(self.latency_file)
+            print(f"Packet latency written to '{self.latency_file}'")
+        if self.journal is not None:
+            self.journal.close(self.journal_state())
+        console.close()
 
     def show_popup(self, instance, touch):
         if instance.collide_point(*touch.pos):
-            graph_popup = GraphPopup(instance.ax.get_title(), instance.ax.get_ylim())
+            from Graph_Widget import GraphPopup, LINE_COLOR
+
+            if self.streams is None:
+                histories = [(None, self.history, LINE_COLOR)]
+            else:
+                histories = [(name, self.streams.histories[name], color) for name, store, color in self.streams.visible()]
+            graph_popup = GraphPopup(instance.column_name, instance.y_limits, histories, self.scheduler)
             graph_popup.open()
 
 class MapApp(App):
-    def __init__(self, **kwargs):
+    def __init__(self, store, scheduler, streams=None, predictor=None, **kwargs):
         super().__init__(**kwargs)
+        self.store = store
+        self.scheduler = scheduler
+        self.streams = streams
+        self.predictor = predictor
+        self.centered = False
+        self.drawn_counts = {}
+
+    def current_store(self):
+        # The marker follows the selected stream, or the first when all are overlaid
+        if self.streams is None:
+            return self.store
+        return self.streams.current()[1]
 
     def get_latest_position(self):
+        store = self.current_store()
+        if not len(store):
+            return None, None
         try:
-            while True:
-                df = pd.read_csv('DATA.csv')
-                df = df.dropna(axis=1)
-                latitud = float(df['GNSS_LATITUDE'].iloc[-1])
-                longitud = float(df['GNSS_LONGITUDE'].iloc[-1])
-                return latitud, longitud
+            latitud = float(store.latest('GNSS_LATITUDE'))
+            longitud = float(store.latest('GNSS_LONGITUDE'))
+            return latitud, longitud
         except Exception as e:
-            print(f"Error: {e}")
+            console.log(f"Error: {e}")
             return None, None
 
     def build(self):
+        from kivy.garden.mapview import MapView, MapMarker
+        from kivy.utils import get_color_from_hex
+        from Map_Layers import CachedMapSource, GroundTrackLayer, LandingLayer
+        from Tile_Store import TileStore
+
         layout = FloatLayout()
 
         lat, lon = self.get_latest_position()
+        if lat is None:
+            lat, lon = 0, 0
 
         map_container = BoxLayout(orientation='vertical', size_hint=(1, 1), pos_hint={'x': 0.0, 'y': 0.0})
-        self.mapview = MapView(zoom=10, lat=lat, lon=lon)
+        # Tiles are read from tiles.mbtiles, see Tile_Store.py to fill it before going to the field
+        self.mapview = MapView(zoom=10, lat=lat, lon=lon, map_source=CachedMapSource(TileStore()))
+        if self.streams is None:
+            self.tracks = [GroundTrackLayer(self.store)]
+        else:
+            # Every stream's track is always drawn, each in the colour of its graph lines
+            self.tracks = [GroundTrackLayer(store, get_color_from_hex(color)) for name, store, color in self.streams.all_streams()]
+        for track in self.tracks:
+            self.mapview.add_layer(track)
+        # Where it is expected to come down, for the recovery team
+        if self.streams is None:
+            self.landings = [LandingLayer(self.predictor)] if self.predictor is not None else []
+        else:
+            self.landings = [LandingLayer(self.streams.predictors[name], get_color_from_hex(color))
+                             for name, store, color in self.streams.all_streams()]
+        for landing in self.landings:
+            self.mapview.add_layer(landing)
         self.marker = MapMarker(lat=lat, lon=lon, source='image.png')
         self.mapview.add_marker(self.marker)
         map_container.add_widget(self.mapview)
@@ -249,7 +666,7 @@ class MapApp(App):
         layout.add_widget(zoom_in_button)
         layout.add_widget(zoom_out_button)
 
-        Clock.schedule_interval(self.update_positions, 1)
+        self.scheduler.add(self.update_positions, interval=1, widget=layout)
 
         return layout
 
@@ -260,69 +677,79 @@ class MapApp(App):
         self.mapview.zoom -= 1
 
     def update_positions(self, dt):
+        for track in self.tracks:
+            if self.drawn_counts.get(track) != track.store.count:
+                self.drawn_counts[track] = track.store.count
+                track.reposition()
+        for landing in self.landings:
+            if self.drawn_counts.get(landing) is not landing.predictor.prediction:
+                self.drawn_counts[landing] = landing.predictor.prediction
+                landing.reposition()
+
         lati, long = self.get_latest_position()
+        if lati is None:
+            return
 
         self.marker.lat = float(lati)
         self.marker.lon = float(long)
+        if not self.centered:
+            self.mapview.center_on(self.marker.lat, self.marker.lon)
+            self.centered = True
         #print(self.marker.lat)
         #print(self.marker.lon)
 
 class AltitudeApp(App):
+    def __init__(self, store, scheduler, metrics=None, predictor=None, **kwargs):
+        super().__init__(**kwargs)
+        self.store = store
+        self.scheduler = scheduler
+        self.metrics = metrics
+        self.predictor = predictor
+        self.drawn_count = 0
+
     def build(self):
+        import matplotlib.pyplot as plt
+        from kivy.garden.matplotlib import FigureCanvasKivyAgg
+        from Decimate import minmax_decimate
+        from Descent_Profile import DescentEnvelope, descent_curve
+
+        self.envelope = DescentEnvelope()
+
         layout = FloatLayout()
         plt.style.use('dark_background')
 
         fig, ax1 = plt.subplots(figsize=(10, 6))
         ax1.set_title('Live Altitude Data')
 
-        x_range = np.linspace(0, 271.066)
-        x_range_min = np.linspace(0, 526.655)
-        x_range_max = np.linspace(0, 183.766)
-
-        def main_function(x):
-            if x <= 21.413:
-                return 900 - (400/21.413) * x
-            else:
-                return 500 - (500/249.653) * (x - 21.413)
-        
-        def min_function(x):
-            if x <= 28.079:
-                return 900 - (400/28.079) * x
-            else:
-                return 500 - (500/498.576) * (x - 28.079)
-
-        def max_function(x):
-            if x <= 17.413:
-                return 900 - (400/17.413) * x
-            else:
-                return 500 - (500/166.353) * (x - 17.413)
-        
-        ax1.plot(x_range, [main_function(x) for x in x_range], label='Main Function', linestyle = 'dashed')
-        ax1.plot(x_range_min, [min_function(x) for x in x_range_min], label='Min Function', linestyle='dashed', color='#FFA500')
-        ax1.plot(x_range_max, [max_function(x) for x in x_range_max], label='Max Function', linestyle='dashed', color='#FFA500')
+        ax1.plot(*descent_curve(self.envelope.nominal), label='Main Function', linestyle = 'dashed')
+        ax1.plot(*descent_curve(self.envelope.slow), label='Min Function', linestyle='dashed', color='#FFA500')
+        ax1.plot(*descent_curve(self.envelope.fast), label='Max Function', linestyle='dashed', color='#FFA500')
 
-        x_values = []
-        altitude_values = []
-        line, = ax1.plot(x_values, altitude_values, marker="_", label='Altitude')
+        line, = ax1.plot([], [], marker="_", label='Altitude')
+        prediction_line, = ax1.plot([], [], linestyle='dotted', color='cyan', label='Predicted landing')
+        apogee_marker, = ax1.plot([], [], marker='v', markersize=10, linestyle='none', color='red', label='Apogee')
 
         ax1.set_xlabel('Time (seconds)')
         ax1.set_ylabel('Altitude')
         ax1.grid(color='white')
         ax1.legend()
 
-        self.last_plotted_index = -1
         start_time = datetime.datetime.now()
 
         def update_plot(dt):
-            csv_data = pd.read_csv('Altitude.csv')
-            new_x_values = csv_data['PACKET_COUNT']
-            new_altitude_values = csv_data['ALTITUDE']
-
-            if self.last_plotted_index < len(new_x_values) - 1:
-                self.last_plotted_index += 1
-                x_values.append(new_x_values[self.last_plotted_index])
-                altitude_values.append(new_altitude_values[self.last_plotted_index])
-                line.set_data(x_values, altitude_values)
+            if self.store.count != self.drawn_count:
+                self.drawn_count = self.store.count
+                # Bounded by the plot width, so relim stays cheap however long the flight is
+                line.set_data(*minmax_decimate(self.store.window('PACKET_COUNT'), self.store.window('ALTITUDE'), int(ax1.bbox.width)))
+                if self.metrics is not None and self.metrics.apogee is not None:
+                    time_stamp, packet, altitude = self.metrics.apogee
+                    apogee_marker.set_data([packet], [altitude])
+                prediction = self.predictor.prediction if self.predictor is not None else None
+                if prediction is not None and prediction.packet is not None:
+                    prediction_line.set_data([prediction.packet, prediction.landing_packet],
+                                             [prediction.altitude, self.predictor.ground_altitude])
+                else:
+                    prediction_line.set_data([], [])
                 ax1.relim()
                 ax1.autoscale_view()
 
@@ -330,15 +757,60 @@ class AltitudeApp(App):
                 ax1.set_title(f'Live Altitude Data (Time Elapsed: {time_elapsed.total_seconds():.2f} seconds)')
 
                 self.canvas.draw()
-            else:
-                Clock.unschedule(update_plot)
+                self.update_status()
 
-        Clock.schedule_interval(update_plot, 1)
+        self.scheduler.add(update_plot, interval=1, widget=layout)
 
         self.canvas = FigureCanvasKivyAgg(fig)
         layout.add_widget(self.canvas)
 
+        self.status_label = Label(text='', font_size='18sp', size_hint=(0.4, 0.05), pos_hint={'x': 0.3, 'y': 0.8})
+        layout.add_widget(self.status_label)
+
         return layout
-    
+
+    def update_status(self):
+        if not len(self.store):
+            self.status_label.text = ''
+            return
+        deviation, inside = self.envelope.check(float(self.store.latest('PACKET_COUNT')), float(self.store.latest('ALTITUDE')))
+        rate = ''
+        if self.metrics is not None and self.metrics.descent_rate is not None:
+            rate = f", descending {self.metrics.descent_rate:.1f} m/s"
+        if self.predictor is not None and self.predictor.prediction is not None:
+            prediction = self.predictor.prediction
+            rate += f", landing in {prediction.seconds:.0f} \u00b1 {prediction.sigma_seconds:.1f} s"
+        if inside:
+            self.status_label.text = f"Inside envelope ({deviation:+.1f} m from nominal{rate})"
+            self.status_label.color = (0, 1, 0, 1)
+        else:
+            self.status_label.text = f"OUTSIDE envelope ({deviation:+.1f} m from nominal{rate})"
+            self.status_label.color = (1, 0, 0, 1)
+
+def parse_args():
+    # Kivy keeps the options after '--' for the app: python Finalapp.py -- --serial /dev/ttyUSB0
+    parser = argparse.ArgumentParser(description='CanSat ground station')
+    add_source_arguments(parser)
+    parser.add_argument('--connect', metavar='HOST:PORT', help='view the flight served by Telemetry_Server.py instead of reading packets here')
+    parser.add_argument('--ingest-process', action='store_true',
+                        help='read, validate and record packets in a separate process that shares its store with the window')
+    parser.add_argument('--fps', type=int, default=20, help='maximum redraws per second')
+    parser.add_argument('--renderer', choices=['matplotlib', 'kivy'], default='matplotlib',
+                        help='draw the Graphs tab with matplotlib or straight with Kivy graphics, which costs far less per frame')
+    parser.add_argument('--startup-timing', action='store_true', help='print time spent in imports, building each tab and the first frame')
+    parser.add_argument('--latency', metavar='FILE', help='track how long packets take to be parsed, stored, drawn and shown and write the histograms to FILE on exit')
+    parser.add_argument('--latency-overlay', action='store_true', help='show rolling packet latency percentiles on screen')
+    parser.add_argument('--journal', metavar='FILE', help='keep every packet in FILE so a restart after a crash carries on where it stopped; delete it before a new flight')
+    parser.add_argument('--journal-sync', type=float, default=1.0, metavar='SECONDS', help='how often the journal is forced to disk')
+    parser.add_argument('--profile', action='store_true', help='time every frame callback and report the slowest every 5 s; F12 toggles it while running')
+    parser.add_argument('--profile-stacks', action='store_true', help='also sample the stack while a frame is over budget; shift+F12 toggles it')
+    return parser.parse_args()
+
 if __name__ == '__main__':
-    CombinedApp().run()
\ No newline at end of file
+    args = parse_args()
+    startup_timer.enabled = args.startup_timing
+    # Several streams, a server or an ingest process read the source themselves
+    streams = make_streams(args)
+    source = make_source(args) if streams is None else None
+    CombinedApp(source, args.fps, args.latency, args.latency_overlay, streams, make_validation(args),
+                args.journal, args.journal_sync, args.renderer, args.profile, args.profile_stacks).run()
@@ -0,0 +1,167 @@
+import numpy as np
+
+from Decimate import minmax_decimate
+
+# The columns on the Graphs tab, which can be opened in the zoomable popup
+HISTORY_COLUMNS = ['ALTITUDE', 'TEMPERATURE', 'VOLTAGE', 'PRESSURE', 'VIBRATION_DATA', 'PACKET_COUNT']
+
+# Packets per block grow by this much from one level to the next
+FACTOR = 8
+
+
+def grow(array, used, extra):
+    if used + extra <= len(array):
+        return array
+    bigger = np.empty(max(2 * len(array), used + extra), dtype=array.dtype)
+    bigger[:used] = array[:used]
+    return bigger
+
+
+def reduce_blocks(level, first, last, factor):
+    # Lowest and highest value, with their times, of every factor children in first:last
+    time_low, low, time_high, high = (array[first:last].reshape(-1, factor) for array in level)
+    rows = np.arange(len(low))
+    # A block with some NaN still has extremes, one with only NaN stays NaN
+    lowest = np.where(np.isnan(low), np.inf, low).argmin(axis=1)
+    highest = np.where(np.isnan(high), -np.inf, high).argmax(axis=1)
+    return (time_low[rows, lowest], low[rows, lowest], time_high[rows, highest], high[rows, highest])
+
+
+class Timeline:
+    # The time of every packet, kept once for all the pyramids of a FlightHistory
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.array = np.empty(1024)
+        self.count = 0
+
+    def extend(self, times):
+        self.array = grow(self.array, self.count, len(times))
+        self.array[self.count:self.count + len(times)] = times
+        self.count += len(times)
+
+
+class MinMaxPyramid:
+    # A column's whole flight at every zoom: level 0 is every packet, a block at
+    # level n holds the min and max of factor ** n packets. Blocks are only ever
+    # added, from the new packets, so keeping it costs the same whatever the length.
+    # The packet times are the timeline's, extended before the values are
+    def __init__(self, timeline, factor=FACTOR):
+        self.timeline = timeline
+        self.factor = factor
+        self.clear()
+
+    def clear(self):
+        values = np.empty(1024)
+        # [time of low, low, time of high, high] per block; at level 0 both are the packet itself
+        self.levels = [[self.timeline.array, values, self.timeline.array, values]]
+        self.counts = [0]
+
+    def __len__(self):
+        return self.counts[0]
+
+    def extend(self, values):
+        used = self.counts[0]
+        values_array = grow(self.levels[0][1], used, len(values))
+        values_array[used:used + len(values)] = values
+        # The timeline may have moved to a bigger array
+        self.levels[0] = [self.timeline.array, values_array, self.timeline.array, values_array]
+        self.counts[0] += len(values)
+
+        level = 1
+        while self.counts[level - 1] >= self.factor:
+            if level == len(self.levels):
+                self.levels.append([np.empty(64) for i in range(4)])
+                self.counts.append(0)
+            done = self.counts[level]
+            ready = self.counts[level - 1] // self.factor
+            if ready > done:
+                blocks = reduce_blocks(self.levels[level - 1], done * self.factor, ready * self.factor, self.factor)
+                for i, values in enumerate(blocks):
+                    self.levels[level][i] = grow(self.levels[level][i], done, len(values))
+                    self.levels[level][i][done:ready] = values
+                self.counts[level] = ready
+            level += 1
+
+    def times(self):
+        return self.timeline.array[:self.counts[0]]
+
+    def query(self, x_min, x_max, points):
+        # About 2 * points samples covering x_min to x_max, from the coarsest level that
+        # still has a block per point; one packet either side is included so the line
+        # runs to the axes edges
+        times = self.times()
+        first = max(int(np.searchsorted(times, x_min, side='left')) - 1, 0)
+        last = min(int(np.searchsorted(times, x_max, side='right')) + 1, len(times))
+        if last <= first:
+            return np.empty(0), np.empty(0)
+        level = 0
+        while level + 1 < len(self.levels) and (last - first) // self.factor ** (level + 1) >= points:
+            level += 1
+
+        # The packets at both ends are always kept so the line spans the whole range
+        ends = [first, last - 1] if level else []
+        xs, ys = [times[ends]], [self.levels[0][1][ends]]
+        while level >= 0:
+            size = self.factor ** level
+            # Whole blocks of this level, the ragged end comes from the finer ones
+            start = first // size
+            stop = min(-(-last // size), self.counts[level]) if level else last
+            if stop > start:
+                time_low, low, time_high, high = (array[start:stop] for array in self.levels[level])
+                if level:
+                    # The two extremes of every block in time order
+                    low_first = time_low <= time_high
+                    xs.append(np.column_stack((np.where(low_first, time_low, time_high), np.where(low_first, time_high, time_low))).ravel())
+                    ys.append(np.column_stack((np.where(low_first, low, high), np.where(low_first, high, low))).ravel())
+                else:
+                    xs.append(time_low)
+                    ys.append(low)
+                first = max(first, stop * size)
+            if first >= last:
+                break
+            level -= 1
+        x, y = np.concatenate(xs), np.concatenate(ys)
+        # Blocks that straddle the first packet have extremes on either side of it
+        order = np.argsort(x, kind='stable')
+        # That level has up to factor blocks a point, two samples each; one more pass
+        # over just those keeps the lowest and highest of every point
+        return minmax_decimate(x[order], y[order], points)
+
+
+class FlightHistory:
+    # Every packet of a flight for the graph popup, however long ago it left the store.
+    # Subscribed to the validator, so packets come in PACKET_COUNT order
+    def __init__(self, columns=HISTORY_COLUMNS, factor=FACTOR):
+        self.timeline = Timeline()
+        self.pyramids = {name: MinMaxPyramid(self.timeline, factor) for name in columns}
+        self.count = 0
+
+    def clear(self):
+        # For a replay seek
+        self.timeline.clear()
+        for pyramid in self.pyramids.values():
+            pyramid.clear()
+        self.count += 1
+
+    def __len__(self):
+        return len(next(iter(self.pyramids.values())))
+
+    def update(self, count, columns):
+        self.timeline.extend(columns['TIME_STAMPING'])
+        for name, pyramid in self.pyramids.items():
+            # Every pyramid has a value for every packet so they stay the same length
+            values = columns.get(name)
+            pyramid.extend(values if values is not None else np.full(count, np.nan))
+        self.count += count
+
+    def span(self):
+        times = self.timeline.array[:self.timeline.count]
+        valid = times[np.isfinite(times)]
+        if not len(valid):
+            return None
+        return float(valid[0]), float(valid[-1])
+
+    def query(self, name, x_min, x_max, points):
+        return self.pyramids[name].query(x_min, x_max, points)
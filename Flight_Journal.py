@@ -0,0 +1,133 @@
+import json
+import os
+import queue
+import threading
+
+import numpy as np
+
+from Telemetry_Store import ALTITUDE_COLUMNS, VALIDATED_COLUMNS, to_array
+
+JOURNAL_FILE = 'flight.journal'
+
+CHECKPOINT = 'checkpoint'
+CLOSE = 'close'
+
+
+def record_dtype(columns):
+    # Little-endian so a journal can be read on any machine
+    return np.dtype([(name, np.dtype(dtype).newbyteorder('<')) for name, dtype in columns])
+
+
+class FlightJournal:
+    # Everything stored during the flight, appended as fixed size binary records,
+    # one file per stream, so a crashed ground station can pick up where it was.
+    # Writes go through a thread; every sync_interval the files are fsynced
+    # together and a small checkpoint of what isn't in them (source offsets,
+    # validator and metrics state) is written next to them. A restart maps the
+    # records up to the last checkpoint instead of parsing DATA.csv again
+    def __init__(self, path=JOURNAL_FILE, sync_interval=1.0):
+        self.path = path
+        self.checkpoint_path = path + '.checkpoint'
+        self.sync_interval = sync_interval
+        self.paths = {'DATA': path, 'ALTITUDE': path + '.altitude'}
+        self.dtypes = {'DATA': record_dtype(VALIDATED_COLUMNS), 'ALTITUDE': record_dtype(ALTITUDE_COLUMNS)}
+        # Records handed to the writer so far
+        self.records = {name: 0 for name in self.paths}
+        self.resumed = False
+        self.queue = queue.SimpleQueue()
+        self.thread = None
+
+    def load(self, reread=True):
+        # (checkpoint, {stream: records}) as of the last checkpoint, or None for a new journal.
+        # reread is False for a source that can't be read again from the checkpoint, a
+        # radio: the records written after it are all there is of those packets, and stay
+        try:
+            with open(self.checkpoint_path) as f:
+                checkpoint = json.load(f)
+            records = {}
+            counts = {}
+            for name, dtype in self.dtypes.items():
+                count = checkpoint['records'][name]
+                if not reread and os.path.exists(self.paths[name]):
+                    count = max(count, os.path.getsize(self.paths[name]) // dtype.itemsize)
+                counts[name] = count
+                # Mapped rather than read: only the pages used are touched
+                records[name] = np.memmap(self.paths[name], dtype=dtype, mode='r', shape=(count,)) if count else np.empty(0, dtype)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Error: can't resume from '{self.checkpoint_path}': {e}")
+            return None
+        self.records = counts
+        self.resumed = True
+        return checkpoint, records
+
+    def start(self):
+        if not self.resumed and os.path.exists(self.checkpoint_path):
+            # A new journal; the old checkpoint would describe files about to be overwritten
+            os.remove(self.checkpoint_path)
+        files = {}
+        for name, path in self.paths.items():
+            if self.resumed and os.path.exists(path):
+                # Anything after the records kept is read from the source again, or was
+                # only part of a record
+                f = open(path, 'r+b')
+                f.truncate(self.records[name] * self.dtypes[name].itemsize)
+                f.seek(0, os.SEEK_END)
+            else:
+                f = open(path, 'wb')
+            files[name] = f
+        self.thread = threading.Thread(target=self.run, args=(files,), name='FlightJournal', daemon=True)
+        self.thread.start()
+
+    def record(self, stream, count, columns):
+        # Called on the UI thread with typed columns, so all it does is pack and hand them over
+        records = np.empty(count, dtype=self.dtypes[stream])
+        for name in records.dtype.names:
+            values = columns.get(name)
+            records[name] = values[len(values) - count:] if values is not None else to_array([''] * count, records.dtype[name])
+        self.records[stream] += count
+        self.queue.put((stream, records.tobytes()))
+
+    def record_rows(self, stream, rows):
+        if rows:
+            self.record(stream, len(rows), {name: to_array([row.get(name, '') for row in rows], dtype.type)
+                                            for name, (dtype, offset) in self.dtypes[stream].fields.items()})
+
+    def checkpoint(self, state):
+        # state must describe the moment after the last record handed over
+        self.queue.put((CHECKPOINT, dict(state, records=dict(self.records))))
+
+    def close(self, state=None):
+        if self.thread is None:
+            return
+        if state is not None:
+            self.checkpoint(state)
+        self.queue.put((CLOSE, None))
+        self.thread.join(timeout=5)
+        self.thread = None
+
+    def run(self, files):
+        while True:
+            item, data = self.queue.get()
+            if item == CLOSE:
+                break
+            if item == CHECKPOINT:
+                # One fsync per file covers every batch since the last checkpoint
+                for f in files.values():
+                    f.flush()
+                    os.fsync(f.fileno())
+                self.write_checkpoint(data)
+            else:
+                files[item].write(data)
+        for f in files.values():
+            f.close()
+
+    def write_checkpoint(self, state):
+        # Written aside and renamed over the old one, so a crash leaves one or the other whole
+        temporary = self.checkpoint_path + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.checkpoint_path)
@@ -0,0 +1,152 @@
+import collections
+
+import numpy as np
+
+from Telemetry_Store import MISSING_INT
+
+SMOOTHED = ['VOLTAGE', 'TEMPERATURE', 'VIBRATION_DATA']
+
+# Metres below the highest altitude so far before it counts as apogee, so sensor noise at the top doesn't
+APOGEE_DROP = 10
+
+
+def ewma(previous, values, alpha):
+    # Same result as feeding the values in one at a time, without a Python loop
+    values = values[np.isfinite(values)]
+    if not len(values):
+        return previous
+    if previous is None:
+        previous, values = float(values[0]), values[1:]
+    weights = (1 - alpha) ** np.arange(len(values) - 1, -1, -1)
+    return float(previous * (1 - alpha) ** len(values) + alpha * np.dot(weights, values))
+
+
+class RollingExtremes:
+    # Min and max over the last window seconds, kept per batch: each batch is
+    # reduced once when it arrives and dropped once it is older than the window
+    def __init__(self, window):
+        self.window = window
+        self.batches = collections.deque()
+
+    def add(self, times, values):
+        valid = np.isfinite(times) & np.isfinite(values)
+        if not valid.any():
+            return
+        # A batch longer than the window, like the history sent after a replay seek, only counts for its end
+        valid &= times >= times[valid].max() - self.window
+        times = times[valid]
+        values = values[valid]
+        self.batches.append((times.max(), values.min(), values.max()))
+        latest = max(end for end, low, high in self.batches)
+        while self.batches[0][0] < latest - self.window:
+            self.batches.popleft()
+
+    def min(self):
+        return min((low for end, low, high in self.batches), default=None)
+
+    def max(self):
+        return max((high for end, low, high in self.batches), default=None)
+
+
+class FlightMetrics:
+    # Derived values kept up to date from each new batch alone, never from the history
+    def __init__(self, alpha=0.1, window=10, apogee_drop=APOGEE_DROP):
+        self.alpha = alpha
+        # Seconds covered by the rolling min and max; the descent rate is in m/s, positive going down
+        self.window = window
+        self.apogee_drop = apogee_drop
+        self.subscribers = []
+        self.clear()
+
+    def clear(self):
+        # Back to before the first packet, for a replay seek
+        self.descent_rate = None
+        self.smoothed = {name: None for name in SMOOTHED}
+        self.extremes = {name: RollingExtremes(self.window) for name in SMOOTHED}
+        # (TIME_STAMPING, PACKET_COUNT, ALTITUDE) of the highest point so far, and of apogee once it is passed
+        self.peak = None
+        self.apogee = None
+        self.state = None
+        # (TIME_STAMPING, old FSW_STATE, new FSW_STATE)
+        self.transitions = []
+        self.last = None
+
+    def checkpoint(self):
+        # Plain values for Flight_Journal, so a restart doesn't go over the flight again
+        return {'descent_rate': self.descent_rate, 'smoothed': self.smoothed,
+                'extremes': {name: [[float(value) for value in batch] for batch in extremes.batches]
+                             for name, extremes in self.extremes.items()},
+                'peak': self.peak, 'apogee': self.apogee, 'state': self.state, 'transitions': self.transitions,
+                'last': None if self.last is None else [float(value) for value in self.last]}
+
+    def restore(self, state):
+        self.descent_rate = state['descent_rate']
+        self.smoothed.update(state['smoothed'])
+        for name, batches in state['extremes'].items():
+            self.extremes[name].batches.extend(tuple(batch) for batch in batches)
+        self.peak = None if state['peak'] is None else tuple(state['peak'])
+        self.apogee = None if state['apogee'] is None else tuple(state['apogee'])
+        self.state = state['state']
+        self.transitions = [tuple(transition) for transition in state['transitions']]
+        self.last = None if state['last'] is None else tuple(state['last'])
+
+    def subscribe(self, callback):
+        # callback(metrics) after every batch
+        self.subscribers.append(callback)
+
+    def update(self, count, columns):
+        # Subscribed to the validator, so packets come in PACKET_COUNT order
+        times = columns['TIME_STAMPING']
+        if 'ALTITUDE' in columns:
+            self.update_altitude(times, columns['PACKET_COUNT'], columns['ALTITUDE'])
+        if 'FSW_STATE' in columns:
+            self.update_state(times, columns['FSW_STATE'])
+        for name in SMOOTHED:
+            if name in columns:
+                self.smoothed[name] = ewma(self.smoothed[name], columns[name], self.alpha)
+                self.extremes[name].add(times, columns[name])
+        for callback in self.subscribers:
+            callback(self)
+
+    def update_altitude(self, times, packets, altitudes):
+        valid = np.isfinite(times) & np.isfinite(altitudes)
+        times, packets, altitudes = times[valid], packets[valid], altitudes[valid]
+        if not len(times):
+            return
+
+        # Descent rate between consecutive packets, this batch's first against the last one before it
+        if self.last is not None:
+            rate_times = np.append(self.last[0], times)
+            rate_altitudes = np.append(self.last[1], altitudes)
+        else:
+            rate_times, rate_altitudes = times, altitudes
+        dt = np.diff(rate_times)
+        moved = dt > 0
+        self.descent_rate = ewma(self.descent_rate, -np.diff(rate_altitudes)[moved] / dt[moved], self.alpha)
+        self.last = (times[-1], altitudes[-1])
+
+        highest = int(np.argmax(altitudes))
+        if self.peak is None or altitudes[highest] > self.peak[2]:
+            self.peak = (float(times[highest]), int(packets[highest]), float(altitudes[highest]))
+            after = altitudes[highest:]
+        else:
+            after = altitudes
+        if self.apogee is None and after.min() <= self.peak[2] - self.apogee_drop:
+            self.apogee = self.peak
+
+    def update_state(self, times, states):
+        valid = states != MISSING_INT
+        times, states = times[valid], states[valid]
+        if not len(states):
+            return
+        previous = states if self.state is None else np.append(self.state, states)
+        changed = np.flatnonzero(previous[1:] != previous[:-1])
+        if self.state is not None:
+            # previous is one longer than times here
+            self.transitions.extend(zip(times[changed].tolist(), previous[changed].tolist(), previous[changed + 1].tolist()))
+        else:
+            self.transitions.extend(zip(times[changed + 1].tolist(), previous[changed].tolist(), previous[changed + 1].tolist()))
+        self.state = int(states[-1])
+
+    def state_since(self):
+        return self.transitions[-1][0] if self.transitions else None
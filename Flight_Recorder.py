@@ -0,0 +1,168 @@
+import csv
+import datetime
+import itertools
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from Telemetry_Store import DATA_COLUMNS, to_array
+
+FLUSH = 'flush'
+CLOSE = 'close'
+
+
+def session_path(directory='', extension='csv'):
+    # A new file for every run and every export, so none is ever written over
+    stamp = datetime.datetime.now().strftime('%Y-%m-%d %H-%M-%S')
+    path = os.path.join(directory, f"Telemetry data {stamp}.{extension}")
+    number = 2
+    while os.path.exists(path):
+        path = os.path.join(directory, f"Telemetry data {stamp} {number}.{extension}")
+        number += 1
+    return path
+
+
+class FlightRecorder:
+    def __init__(self, path=None, export_path=None, columns=DATA_COLUMNS, batch_size=64, flush_interval=1.0, streams=False,
+                 append=False, keep=None):
+        self.path = path or session_path()
+        # Carry on an existing recording instead of starting a new one
+        self.append = append
+        # None names every export after the time it was made
+        self.export_path = export_path
+        self.columns = columns
+        # With several streams every row starts with the name of the stream it came from
+        self.streams = streams
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.SimpleQueue()
+        self.recorded = 0
+        if append and os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            # Before anything is handed over, so the count is right from the start
+            self.recorded = self.truncate(keep)
+        # Rows given to the recorder so far, written or not; a checkpoint keeps this many
+        self.handed = self.recorded
+        self.thread = threading.Thread(target=self.run, name='FlightRecorder', daemon=True)
+        self.thread.start()
+
+    def record(self, rows):
+        # Called on the UI thread, so all it does is hand the batch over
+        self.handed += len(rows)
+        self.queue.put(rows)
+
+    def record_stream(self, name, count, columns):
+        self.handed += count
+        self.queue.put((name, count, columns))
+
+    def flush(self):
+        self.queue.put(FLUSH)
+
+    def sync(self):
+        # Returns once every row handed over so far is on disk, for a checkpoint that counts them
+        if self.thread.is_alive():
+            done = threading.Event()
+            self.queue.put(done)
+            done.wait(timeout=2)
+
+    def close(self):
+        if self.thread.is_alive():
+            self.queue.put(CLOSE)
+            self.thread.join(timeout=2)
+
+    def open(self):
+        if self.append and os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            return open(self.path, 'a', newline='')
+        # 'x' refuses to write over a recording that is already there
+        f = open(self.path, 'x', newline='')
+        csv.writer(f).writerow((['STREAM'] if self.streams else []) + [name for name, dtype in self.columns])
+        return f
+
+    def truncate(self, rows=None):
+        # Keeps the first rows rows, or every whole one for None, and a line cut off
+        # by the crash goes; returns how many are left
+        with open(self.path, 'r+b') as f:
+            f.readline()
+            kept = 0
+            end = f.tell()
+            while rows is None or kept < rows:
+                line = f.readline()
+                if not line.endswith(b'\n'):
+                    break
+                kept += 1
+                end = f.tell()
+            f.truncate(end)
+        if rows is not None and kept < rows:
+            print(f"Error: {rows - kept} packets handed to the recorder before the crash never reached '{self.path}'")
+        return kept
+
+    def run(self):
+        # The file is only created with the first batch, so a run without packets leaves none behind
+        f = None
+        writer = None
+        pending = 0
+        last_flush = time.monotonic()
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = None
+
+            if item == CLOSE:
+                break
+            if isinstance(item, threading.Event):
+                if f is not None:
+                    f.flush()
+                    os.fsync(f.fileno())
+                    pending = 0
+                item.set()
+                continue
+            if writer is None and item is not None and item != FLUSH:
+                try:
+                    f = self.open()
+                    writer = csv.writer(f)
+                except OSError as e:
+                    print(f"Error: not recording to '{self.path}': {e}")
+                    writer = False
+            if not writer:
+                # Nothing to write to; batches are dropped until close
+                continue
+            if isinstance(item, tuple):
+                writer.writerows(self.stream_rows(*item))
+                pending += item[1]
+                self.recorded += item[1]
+            elif item is not None and item != FLUSH:
+                writer.writerows(self.typed_rows(item))
+                pending += len(item)
+                self.recorded += len(item)
+
+            now = time.monotonic()
+            if pending and (item == FLUSH or pending >= self.batch_size or now - last_flush >= self.flush_interval):
+                f.flush()
+                pending = 0
+                last_flush = now
+        if f is not None:
+            f.close()
+
+    def typed_rows(self, rows):
+        columns = [to_array([row.get(name, '') for row in rows], dtype).tolist() for name, dtype in self.columns]
+        return zip(*columns)
+
+    def stream_rows(self, stream, count, columns):
+        values = [columns[name].tolist() if name in columns else [''] * count for name, dtype in self.columns]
+        return zip(itertools.repeat(stream, count), *values)
+
+    def export_columns(self, store):
+        # Only what is still in the store, its newest capacity packets; the recording
+        # has the whole flight. The copy is a few memcpys on the UI thread; compressing
+        # and writing happen in the background. Returns the file written to
+        path = self.export_path
+        if path is None:
+            path = session_path(os.path.dirname(self.path), 'npz')
+            # Taken now, so an export straight after this one can't pick the same name
+            open(path, 'x').close()
+        snapshot = {name: np.array(store.window(name)) for name in store.columns}
+        threading.Thread(target=np.savez_compressed, args=(path,), kwargs=snapshot, name='FlightExport', daemon=True).start()
+        return path
@@ -0,0 +1,131 @@
+import time
+
+import numpy as np
+
+from Telemetry_Feed import CsvTailer, parse_rows
+from Telemetry_Store import DEFAULT_CAPACITY, to_array
+
+SPEEDS = [1, 2, 5, 10, 20, 50, 100]
+
+
+class FlightReplay:
+    # Plays a recorded flight (DATA.csv or a recorded 'Telemetry data' csv) as if it
+    # were arriving now, at any speed, and can jump to any moment of it. The file is
+    # read and indexed by TIME_STAMPING once; after that a seek is a binary search
+    def __init__(self, path, speed=1.0):
+        self.path = path
+        self.header = CsvTailer(path).read_header()
+        if self.header is None:
+            raise ValueError(f"'{path}' has no header line")
+        with open(path, 'rb') as f:
+            f.readline()
+            self.data = f.read()
+
+        # Byte offset where every line starts, and one past the end
+        raw = np.frombuffer(self.data, dtype=np.uint8)
+        self.starts = np.append(0, np.flatnonzero(raw == ord('\n')) + 1)
+        if self.starts[-1] != len(self.data):
+            self.starts = np.append(self.starts, len(self.data))
+
+        column = self.header.index('TIME_STAMPING')
+        lines = self.data.decode('utf-8', errors='replace').split('\n')[:len(self.starts) - 1]
+        fields = [line.split(',', column + 1) for line in lines]
+        times = to_array([f[column] if len(f) > column else '' for f in fields], np.float64)
+        # The index must only go up: a line without a usable time gets the one before it
+        self.times = np.maximum.accumulate(np.where(np.isfinite(times), times, -np.inf))
+
+        self.subscribers = {'DATA': [], 'ALTITUDE': []}
+        self.seek_subscribers = []
+        self.latest = {'DATA': None, 'ALTITUDE': None}
+        self.timing = {'DATA': [], 'ALTITUDE': []}
+        self.line_filter = None
+        self.position = 0
+        self.speed = speed
+        self.playing = True
+        # The flight time at the wall clock time the replay was last started, seeked or changed speed
+        self.anchor_time = self.first()
+        self.anchor_wall = time.monotonic()
+
+    def __len__(self):
+        return len(self.times)
+
+    def first(self):
+        finite = self.times[np.isfinite(self.times)]
+        return float(finite[0]) if len(finite) else 0.0
+
+    def last(self):
+        return float(self.times[-1]) if len(self.times) else 0.0
+
+    def columns(self, stream):
+        if stream == 'ALTITUDE':
+            return ['PACKET_COUNT', 'ALTITUDE']
+        return [name for name in self.header if name]
+
+    def subscribe(self, stream, callback):
+        self.subscribers[stream].append(callback)
+
+    def subscribe_seek(self, callback):
+        # callback() before the packets leading up to a seek are sent, to throw away what came before
+        self.seek_subscribers.append(callback)
+
+    def now(self):
+        if not self.playing:
+            return self.anchor_time
+        return self.anchor_time + (time.monotonic() - self.anchor_wall) * self.speed
+
+    def anchor(self, flight_time):
+        self.anchor_time = flight_time
+        self.anchor_wall = time.monotonic()
+
+    def set_speed(self, speed):
+        self.anchor(self.now())
+        self.speed = speed
+
+    def pause(self):
+        self.anchor(self.now())
+        self.playing = False
+
+    def play(self):
+        self.anchor(self.anchor_time)
+        self.playing = True
+
+    def seek(self, flight_time, history=DEFAULT_CAPACITY):
+        # Everything up to flight_time is sent again as one batch, or only the last
+        # history packets of it, so every tab shows the flight as it was then
+        self.anchor(flight_time)
+        end = int(np.searchsorted(self.times, flight_time, side='right'))
+        for callback in self.seek_subscribers:
+            callback()
+        self.position = max(0, end - history)
+        self.publish(end)
+
+    def poll(self, dt=None):
+        if not self.playing:
+            return
+        end = int(np.searchsorted(self.times, self.now(), side='right'))
+        if end > self.position:
+            self.publish(end)
+        elif self.position >= len(self.times):
+            # Stays on the last packet rather than running on past the end
+            self.pause()
+
+    def publish(self, end):
+        received = time.time()
+        lines = self.data[self.starts[self.position]:self.starts[end]].split(b'\n')
+        self.position = end
+        if self.line_filter is not None:
+            lines = self.line_filter(lines)
+        rows = parse_rows(self.header, lines)
+        if not rows:
+            return
+
+        altitude_rows = [{'PACKET_COUNT': row.get('PACKET_COUNT', ''), 'ALTITUDE': row.get('ALTITUDE', '')} for row in rows]
+        timing = [(len(rows), received, time.time())]
+        for stream, batch in (('DATA', rows), ('ALTITUDE', altitude_rows)):
+            self.timing[stream] = timing
+            self.latest[stream] = batch[-1]
+            for callback in self.subscribers[stream]:
+                callback(batch)
+
+    def stop(self):
+        self.playing = False
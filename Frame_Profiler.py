@@ -0,0 +1,133 @@
+import collections
+import os
+import sys
+import threading
+import time
+import traceback
+
+from Console_Log import console
+
+# Calls and stack samples older than this drop out of the report, in seconds
+WINDOW = 10
+
+# Callbacks and stacks listed in a report
+TOP = 5
+
+# Innermost frames kept per stack sample
+STACK_DEPTH = 8
+
+
+def callback_name(entry):
+    if 'name' in entry:
+        return entry['name']
+    callback = entry['callback']
+    # update_plot is a closure inside AltitudeApp.build, name it after the class
+    return f"{callback.__qualname__.split('.')[0]}.{callback.__name__}"
+
+
+def milliseconds(values, q):
+    return values[min(int(q / 100 * len(values)), len(values) - 1)] * 1000
+
+
+class FrameProfiler:
+    # Times every scheduler callback against the frame budget and keeps the last
+    # window seconds of calls, so a report names whatever is slow right now. An
+    # overrunning frame is put down to its slowest call. With stacks on, a thread
+    # samples the UI thread's stack while a frame is past its budget, catching
+    # the code that is running in the middle of the overrun itself
+    def __init__(self, frame_time, window=WINDOW, report_interval=5, stacks=False):
+        self.frame_time = frame_time
+        self.window = window
+        self.report_interval = report_interval
+        # (finished, name, seconds) per call, (finished, seconds, slowest name) per frame,
+        # (taken, stack) per sample
+        self.calls = collections.deque()
+        self.frames = collections.deque()
+        self.samples = collections.deque()
+        self.frame_start = None
+        self.slowest = (None, 0)
+        self.started = self.last_report = time.perf_counter()
+        self.thread_id = threading.get_ident()
+        self.stacks = False
+        self.sampler = None
+        self.set_stacks(stacks)
+
+    def set_stacks(self, stacks):
+        self.stacks = stacks
+        if stacks and (self.sampler is None or not self.sampler.is_alive()):
+            self.sampler = threading.Thread(target=self.sample, name='FrameProfiler', daemon=True)
+            self.sampler.start()
+
+    def stop(self):
+        self.set_stacks(False)
+        console.log(self.report(time.perf_counter()))
+
+    def start_frame(self, now):
+        self.thread_id = threading.get_ident()
+        self.slowest = (None, 0)
+        self.frame_start = now
+
+    def run(self, name, callback, *args):
+        start = time.perf_counter()
+        callback(*args)
+        finished = time.perf_counter()
+        took = finished - start
+        self.calls.append((finished, name, took))
+        if took > self.slowest[1]:
+            self.slowest = (name, took)
+
+    def end_frame(self, finished):
+        took = finished - self.frame_start
+        self.frame_start = None
+        self.frames.append((finished, took, self.slowest[0]))
+        if finished - self.last_report >= self.report_interval:
+            self.last_report = finished
+            console.log(self.report(finished))
+
+    def sample(self):
+        while self.stacks:
+            time.sleep(self.frame_time / 4)
+            start = self.frame_start
+            if start is None or time.perf_counter() - start <= self.frame_time:
+                continue
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            # Source lines aren't looked up, the file and line are enough to find them
+            summary = traceback.StackSummary.extract(traceback.walk_stack(frame), limit=STACK_DEPTH, lookup_lines=False)
+            stack = tuple(f"{os.path.basename(f.filename)}:{f.lineno} {f.name}" for f in reversed(summary))
+            self.samples.append((time.perf_counter(), stack))
+
+    def prune(self, now):
+        for items in (self.calls, self.frames, self.samples):
+            while items and items[0][0] < now - self.window:
+                items.popleft()
+
+    def report(self, now):
+        self.prune(now)
+        frames = list(self.frames)
+        budget = self.frame_time * 1000
+        if not frames:
+            return f"Frame profile: no frames in the last {self.window} s"
+        times = sorted(took for finished, took, name in frames)
+        over = [name for finished, took, name in frames if took > self.frame_time]
+        lines = [f"Frame profile, last {self.window} s: {len(frames)} frames, {len(over)} over {budget:.0f} ms"
+                 f" (p50 {milliseconds(times, 50):.1f} ms, p99 {milliseconds(times, 99):.1f} ms, max {times[-1] * 1000:.1f} ms)"]
+
+        by_name = {}
+        for finished, name, took in self.calls:
+            by_name.setdefault(name, []).append(took)
+        blamed = collections.Counter(over)
+        span = min(now - self.started, self.window)
+        # Slowest single call first, as that is what a stutter is
+        for name, calls in sorted(by_name.items(), key=lambda item: -max(item[1]))[:TOP]:
+            calls.sort()
+            lines.append(f"  {name:32} {len(calls):6} calls  p50 {milliseconds(calls, 50):7.2f}  p95 {milliseconds(calls, 95):7.2f}"
+                         f"  max {calls[-1] * 1000:7.2f} ms  {sum(calls) / span:6.1%} of the time"
+                         f"  {blamed[name]} overruns")
+
+        stacks = collections.Counter(stack for taken, stack in list(self.samples))
+        for stack, count in stacks.most_common(TOP):
+            lines.append(f"  {count} samples ({count * self.frame_time / 4 * 1000:.0f} ms) over budget in:")
+            lines.extend(f"    {frame}" for frame in stack)
+        return '\n'.join(lines)
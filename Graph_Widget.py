@@ -0,0 +1,267 @@
+import matplotlib.pyplot as plt
+from matplotlib.ticker import FuncFormatter
+import numpy as np
+from kivy.garden.matplotlib import FigureCanvasKivyAgg
+from kivy.uix.popup import Popup
+
+from Decimate import LINE_COLOR, minmax_decimate, time_label, visible_range
+
+# Narrowest the popup zooms to, in seconds
+MIN_SPAN = 0.5
+
+class GraphWidget(FigureCanvasKivyAgg):
+    def __init__(self, column_name, y_limits, store, scheduler, window_span=8, latency=None, streams=None, **kwargs):
+        self.fig, self.ax = plt.subplots()
+        self.store = store
+        # A StreamFeed when several CanSats are watched, then there is a line per stream
+        self.streams = streams
+        self.lines = {}
+        for name, stream_store, color in self.all_streams():
+            line, = self.ax.plot([], [], linestyle='-', linewidth=3, marker='o', color=color, label=name)
+            # Lines are left out of full redraws and drawn on top of the cached background instead
+            line.set_animated(True)
+            self.lines[name] = line
+        if streams is not None:
+            self.ax.legend(loc='upper left', fontsize='small')
+
+        self.y_limits = y_limits
+        self.ax.set_ylim(*y_limits)
+
+        self.fig.set_facecolor('black')
+        self.ax.set_facecolor('black')
+        self.ax.tick_params(axis='x', colors='white')
+        self.ax.tick_params(axis='y', colors='white')
+        self.ax.set_title(column_name, color='white')
+        self.ax.spines['bottom'].set_color('white')
+        self.ax.spines['left'].set_color('white')
+
+        self.column_name = column_name
+        self.window_span = window_span
+        self.latency = latency
+        self.drawn_key = None
+        self.background = None
+
+        super().__init__(self.fig)
+
+        self.mpl_connect('draw_event', self.on_draw)
+        self.scheduler = scheduler
+        self.frame = scheduler.add(self.update_frame, widget=self)
+
+    def stop(self):
+        self.scheduler.remove(self.frame)
+
+    def all_streams(self):
+        if self.streams is None:
+            return [(None, self.store, LINE_COLOR)]
+        return self.streams.all_streams()
+
+    def visible_streams(self):
+        if self.streams is None:
+            return self.all_streams()
+        return self.streams.visible()
+
+    def on_draw(self, event):
+        self.background = self.copy_from_bbox(self.ax.bbox)
+        for line in self.lines.values():
+            self.ax.draw_artist(line)
+
+    def move_window(self, latest):
+        # The window jumps by half its width, so ticks and labels are rebuilt
+        # once every window_span / 2 seconds instead of on every packet
+        start = latest - self.window_span / 2
+        self.ax.set_xlim(start, start + self.window_span)
+        ticks = np.arange(np.ceil(start), start + self.window_span)
+        self.ax.set_xticks(ticks)
+        self.ax.set_xticklabels([time_label(t) for t in ticks], rotation=30, ha='right')
+
+    def update_frame(self, dt):
+        visible = [(name, store) for name, store, color in self.visible_streams() if len(store)]
+        key = tuple((name, store.count) for name, store in visible)
+        if key == self.drawn_key:
+            return
+        self.drawn_key = key
+        if not visible:
+            return
+
+        latest = max(store.latest('TIME_STAMPING') for name, store in visible)
+        x_min, x_max = self.ax.get_xlim()
+        moved = not x_min <= latest <= x_max
+        if moved:
+            self.move_window(latest)
+            x_min, x_max = self.ax.get_xlim()
+
+        for line in self.lines.values():
+            line.set_data([], [])
+        for name, store in visible:
+            # Packet time on x, both arrays are views into the shared store
+            x_data = store.window('TIME_STAMPING')
+            y_data = store.window(self.column_name)
+            start, stop = visible_range(x_data, x_min, x_max)
+            self.lines[name].set_data(*minmax_decimate(x_data[start:stop], y_data[start:stop], int(self.ax.bbox.width)))
+
+        if moved:
+            self.draw()
+        else:
+            self.blit_lines()
+        if self.latency is not None:
+            # Only tracked with a single stream, so x_data and start are the store's
+            self.latency.mark('drawn', self.store.count, self.store.count - len(x_data) + start)
+
+    def blit_lines(self):
+        if self.background is None or self.img_texture is None:
+            self.draw()
+            return
+
+        self.restore_region(self.background)
+        for line in self.lines.values():
+            self.ax.draw_artist(line)
+
+        # Only the axes area is copied back into the texture, extents are top-down like the texture rows
+        region = self.copy_from_bbox(self.ax.bbox)
+        x1, y1, x2, y2 = region.get_extents()
+        self.img_texture.blit_buffer(bytes(region), size=(x2 - x1, y2 - y1), pos=(x1, y1), colorfmt='rgba', bufferfmt='ubyte')
+        self.canvas.ask_update()
+
+class HistoryGraph(FigureCanvasKivyAgg):
+    # The popup's detail view over the whole flight, read from the FlightHistory
+    # pyramids the validator keeps up to date. Scroll to zoom around the pointer,
+    # drag to pan, double tap for the whole flight again
+    def __init__(self, column_name, y_limits, histories, scheduler, **kwargs):
+        self.fig, self.ax = plt.subplots()
+        self.column_name = column_name
+        self.y_limits = y_limits
+        # (name, FlightHistory, color) per stream shown
+        self.histories = histories
+        self.lines = [self.ax.plot([], [], linestyle='-', linewidth=2, marker='o', markersize=3, color=color, label=name)[0]
+                      for name, history, color in histories]
+        if len(histories) > 1:
+            self.ax.legend(loc='upper left', fontsize='small')
+
+        self.fig.set_facecolor('black')
+        self.ax.set_facecolor('black')
+        self.ax.tick_params(axis='x', colors='white', labelrotation=30)
+        self.ax.tick_params(axis='y', colors='white')
+        self.ax.set_title(column_name, color='white')
+        self.ax.spines['bottom'].set_color('white')
+        self.ax.spines['left'].set_color('white')
+        self.ax.xaxis.set_major_formatter(FuncFormatter(self.format_time))
+
+        # None shows the whole flight; once zoomed in the view stays put, unless
+        # its right edge is on the newest packet, then it moves along with it
+        self.view = None
+        self.following = True
+        self.drawn_key = None
+
+        super().__init__(self.fig)
+        self.scheduler = scheduler
+        self.frame = scheduler.add(self.update_frame, interval=0.2, widget=self)
+
+    def stop(self):
+        self.scheduler.remove(self.frame)
+        plt.close(self.fig)
+
+    def format_time(self, t, pos=None):
+        x_min, x_max = self.ax.get_xlim()
+        if x_max - x_min < 10:
+            return f"{time_label(int(t))}.{int(t * 100) % 100:02d}"
+        return time_label(int(t))
+
+    def span(self):
+        spans = [history.span() for name, history, color in self.histories]
+        spans = [span for span in spans if span is not None]
+        if not spans:
+            return None
+        return min(first for first, last in spans), max(last for first, last in spans)
+
+    def update_frame(self, dt):
+        key = tuple(history.count for name, history, color in self.histories)
+        if key != self.drawn_key and (self.view is None or self.following):
+            self.redraw()
+
+    def redraw(self):
+        self.drawn_key = tuple(history.count for name, history, color in self.histories)
+        span = self.span()
+        if span is None:
+            return
+        if self.view is None:
+            x_min, x_max = span[0], max(span[1], span[0] + 1)
+        else:
+            x_min, x_max = self.view
+            if self.following:
+                x_min, x_max = span[1] - (x_max - x_min), span[1]
+                self.view = (x_min, x_max)
+
+        low, high = np.inf, -np.inf
+        for line, (name, history, color) in zip(self.lines, self.histories):
+            x, y = history.query(self.column_name, x_min, x_max, max(int(self.ax.bbox.width), 1))
+            line.set_data(x, y)
+            shown = y[(x >= x_min) & (x <= x_max)]
+            shown = shown[np.isfinite(shown)]
+            if len(shown):
+                low, high = min(low, shown.min()), max(high, shown.max())
+
+        self.ax.set_xlim(x_min, x_max)
+        if low <= high:
+            margin = (high - low) * 0.05 or 1
+            self.ax.set_ylim(low - margin, high + margin)
+        else:
+            self.ax.set_ylim(*self.y_limits)
+        self.draw()
+
+    def data_x(self, touch):
+        return self.ax.transData.inverted().transform((touch.x - self.x, touch.y - self.y))[0]
+
+    def set_view(self, x_min, x_max):
+        span = self.span()
+        if span is None:
+            return
+        if x_max - x_min >= span[1] - span[0]:
+            self.view = None
+            self.following = True
+        else:
+            self.view = (x_min, x_max)
+            self.following = x_max >= span[1]
+        self.redraw()
+
+    def on_touch_down(self, touch):
+        if not self.collide_point(*touch.pos):
+            return super().on_touch_down(touch)
+        x_min, x_max = self.ax.get_xlim()
+        if touch.is_mouse_scrolling:
+            zoom = {'scrolldown': 0.8, 'scrollup': 1.25}.get(touch.button, 1)
+            at = self.data_x(touch)
+            # At least a few packets' worth of time stays on screen
+            width = max((x_max - x_min) * zoom, MIN_SPAN)
+            left = (at - x_min) / (x_max - x_min)
+            self.set_view(at - width * left, at + width * (1 - left))
+        elif touch.is_double_tap:
+            self.set_view(-np.inf, np.inf)
+        else:
+            touch.grab(self)
+        return True
+
+    def on_touch_move(self, touch):
+        if touch.grab_current is not self:
+            return super().on_touch_move(touch)
+        x_min, x_max = self.ax.get_xlim()
+        shift = -touch.dx * (x_max - x_min) / max(self.ax.bbox.width, 1)
+        span = self.span()
+        if span is not None:
+            # Panning stops at either end of the flight
+            shift = min(max(shift, span[0] - x_min), span[1] - x_max)
+        self.set_view(x_min + shift, x_max + shift)
+        return True
+
+    def on_touch_up(self, touch):
+        if touch.grab_current is not self:
+            return super().on_touch_up(touch)
+        touch.ungrab(self)
+        return True
+
+class GraphPopup(Popup):
+    def __init__(self, column_name, y_limits, histories, scheduler, **kwargs):
+        super().__init__(title=f"{column_name}: scroll to zoom, drag to pan, double tap for the whole flight", **kwargs)
+        graph = HistoryGraph(column_name, y_limits, histories, scheduler)
+        self.add_widget(graph)
+        self.bind(on_open=lambda popup: graph.redraw())
+        self.bind(on_dismiss=lambda popup: graph.stop())
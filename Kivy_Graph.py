@@ -0,0 +1,172 @@
+import numpy as np
+from kivy.graphics import Color, Line, Point, Rectangle
+from kivy.graphics.scissor_instructions import ScissorPop, ScissorPush
+from kivy.uix.label import Label
+from kivy.uix.widget import Widget
+from kivy.utils import get_color_from_hex
+
+from Decimate import LINE_COLOR, minmax_decimate, time_label, visible_range
+
+# Room around the plot for the title and the tick labels, in pixels
+MARGIN_LEFT = 60
+MARGIN_BOTTOM = 30
+MARGIN_TOP = 30
+MARGIN_RIGHT = 15
+
+Y_TICKS = 5
+
+X_LABEL_WIDTH = 60
+
+
+class KivyGraph(Widget):
+    # The Graphs tab's live graph drawn with Kivy canvas instructions instead of
+    # matplotlib: each frame only the line's vertices are recomputed, with numpy,
+    # and the GPU draws them; nothing is rasterized on the CPU or uploaded as a
+    # texture. Takes the same spec as GraphWidget and looks the same
+    def __init__(self, column_name, y_limits, store, scheduler, window_span=8, latency=None, streams=None, **kwargs):
+        super().__init__(**kwargs)
+        self.column_name = column_name
+        self.y_limits = y_limits
+        self.store = store
+        self.streams = streams
+        self.window_span = window_span
+        self.latency = latency
+        self.x_limits = None
+        self.drawn_key = None
+
+        self.lines = {}
+        self.markers = {}
+        with self.canvas:
+            Color(0, 0, 0, 1)
+            self.background = Rectangle()
+            Color(1, 1, 1, 1)
+            # The left and bottom spines
+            self.spines = Line(points=[], width=1)
+            self.ticks = Line(points=[], width=1)
+            self.scissor = ScissorPush()
+            for name, stream_store, color in self.all_streams():
+                Color(*get_color_from_hex(color))
+                self.lines[name] = Line(points=[], width=1.5, joint='round')
+                self.markers[name] = Point(points=[], pointsize=2.5)
+            ScissorPop()
+
+        self.title = Label(text=column_name, font_size='14sp')
+        self.add_widget(self.title)
+        if streams is not None:
+            legend = '  '.join(f"[color={color}]{name}[/color]" for name, stream_store, color in self.all_streams())
+            self.legend = Label(text=legend, markup=True, font_size='11sp')
+            self.add_widget(self.legend)
+        else:
+            self.legend = None
+        self.y_labels = [Label(text=f"{value:.4g}", font_size='11sp') for value in np.linspace(*y_limits, Y_TICKS)]
+        self.x_labels = [Label(text='', font_size='11sp') for i in range(int(window_span) + 1)]
+        for label in self.y_labels + self.x_labels:
+            self.add_widget(label)
+
+        self.bind(pos=self.layout, size=self.layout)
+        self.scheduler = scheduler
+        self.frame = scheduler.add(self.update_frame, widget=self)
+
+    def stop(self):
+        self.scheduler.remove(self.frame)
+
+    def all_streams(self):
+        if self.streams is None:
+            return [(None, self.store, LINE_COLOR)]
+        return self.streams.all_streams()
+
+    def visible_streams(self):
+        if self.streams is None:
+            return self.all_streams()
+        return self.streams.visible()
+
+    def plot_area(self):
+        return (self.x + MARGIN_LEFT, self.y + MARGIN_BOTTOM,
+                max(self.width - MARGIN_LEFT - MARGIN_RIGHT, 1), max(self.height - MARGIN_BOTTOM - MARGIN_TOP, 1))
+
+    def layout(self, *args):
+        left, bottom, width, height = self.plot_area()
+        self.background.pos = self.pos
+        self.background.size = self.size
+        self.spines.points = [left, bottom + height, left, bottom, left + width, bottom]
+        x, y = self.to_window(left, bottom)
+        self.scissor.x, self.scissor.y, self.scissor.width, self.scissor.height = int(x), int(y), int(width), int(height)
+
+        self.title.size = (width, MARGIN_TOP)
+        self.title.pos = (left, bottom + height)
+        if self.legend is not None:
+            self.legend.texture_update()
+            self.legend.size = self.legend.texture_size
+            self.legend.pos = (left + 5, bottom + height - self.legend.height - 5)
+        ticks = []
+        for i, label in enumerate(self.y_labels):
+            y = bottom + height * i / (Y_TICKS - 1)
+            label.size = (MARGIN_LEFT - 8, 20)
+            label.text_size = label.size
+            label.halign = 'right'
+            label.valign = 'middle'
+            label.pos = (self.x, y - 10)
+            # Out and back along the spine, so one Line draws every tick
+            ticks += [left, y, left - 4, y, left, y]
+        self.ticks.points = ticks
+        self.place_x_labels()
+        # Everything has moved, the lines have to be recomputed
+        self.drawn_key = None
+
+    def place_x_labels(self):
+        left, bottom, width, height = self.plot_area()
+        for label in self.x_labels:
+            label.text = ''
+        if self.x_limits is None:
+            return
+        x_min, x_max = self.x_limits
+        # Whole seconds, as many as fit side by side
+        step = int(np.ceil(X_LABEL_WIDTH * (x_max - x_min) / width))
+        for label, t in zip(self.x_labels, np.arange(np.ceil(x_min), x_max, step).tolist()):
+            label.text = time_label(t)
+            label.size = (X_LABEL_WIDTH, MARGIN_BOTTOM)
+            label.center_x = left + (t - x_min) / (x_max - x_min) * width
+            label.y = self.y
+
+    def move_window(self, latest):
+        # As GraphWidget: the window jumps by half its width, so the time labels
+        # only change once every window_span / 2 seconds
+        start = float(latest) - self.window_span / 2
+        self.x_limits = (start, start + self.window_span)
+        self.place_x_labels()
+
+    def update_frame(self, dt):
+        visible = [(name, store) for name, store, color in self.visible_streams() if len(store)]
+        key = tuple((name, store.count) for name, store in visible)
+        if key == self.drawn_key:
+            return
+        self.drawn_key = key
+        for name in self.lines:
+            self.lines[name].points = []
+            self.markers[name].points = []
+        if not visible:
+            return
+
+        latest = max(store.latest('TIME_STAMPING') for name, store in visible)
+        if self.x_limits is None or not self.x_limits[0] <= latest <= self.x_limits[1]:
+            self.move_window(latest)
+        x_min, x_max = self.x_limits
+        y_min, y_max = self.y_limits
+        left, bottom, width, height = self.plot_area()
+
+        for name, store in visible:
+            x_data = store.window('TIME_STAMPING')
+            y_data = store.window(self.column_name)
+            start, stop = visible_range(x_data, x_min, x_max)
+            x, y = minmax_decimate(x_data[start:stop], y_data[start:stop], int(width))
+            # Straight into canvas coordinates, interleaved as Line wants them
+            vertices = np.empty((len(x), 2))
+            vertices[:, 0] = left + (x - x_min) * (width / (x_max - x_min))
+            vertices[:, 1] = bottom + (y - y_min) * (height / (y_max - y_min))
+            vertices = vertices[np.isfinite(vertices).all(axis=1)].ravel().tolist()
+            self.lines[name].points = vertices
+            self.markers[name].points = vertices
+
+        if self.latency is not None:
+            # Only tracked with a single stream, so x_data and start are the store's
+            self.latency.mark('drawn', self.store.count, self.store.count - len(x_data) + start)
@@ -0,0 +1,161 @@
+import math
+from collections import namedtuple
+
+import numpy as np
+
+# Metres per degree of latitude, and of longitude at the equator
+METRES_PER_DEGREE = 111320.0
+
+# seconds and time are from the latest packet's TIME_STAMPING, radius is in metres
+Prediction = namedtuple('Prediction', ['time', 'seconds', 'sigma_seconds', 'lat', 'lon', 'radius',
+                                       'packet', 'altitude', 'landing_packet'])
+
+
+class DecayingFit:
+    # Weighted least-squares line y = a + b * t where a sample's weight decays as
+    # exp(-age / tau), kept as running sums so a new batch costs the same however
+    # long the flight has been. t is measured from the newest sample so far
+    def __init__(self, tau):
+        self.tau = tau
+        self.latest = None
+        # sum of w, w t, w t^2, w y, w t y, w y^2, w^2
+        self.sums = np.zeros(7)
+
+    def add(self, times, values):
+        valid = np.isfinite(times) & np.isfinite(values)
+        if not valid.any():
+            return
+        times = times[valid]
+        values = values[valid]
+        latest = times.max()
+        if self.latest is not None:
+            # Move the origin to the new latest sample and age what is already in the sums;
+            # the sum of squared weights ages twice as fast
+            shift = max(latest - self.latest, 0)
+            w, wt, wtt, wy, wty, wyy, ww = self.sums
+            decay = math.exp(-shift / self.tau)
+            self.sums = np.array([w, wt - shift * w, wtt - 2 * shift * wt + shift * shift * w,
+                                  wy, wty - shift * wy, wyy, ww * decay]) * decay
+            latest = self.latest + shift
+        self.latest = float(latest)
+
+        t = times - self.latest
+        weights = np.exp(t / self.tau)
+        self.sums += [weights.sum(), np.dot(weights, t), np.dot(weights, t * t), np.dot(weights, values),
+                      np.dot(weights, t * values), np.dot(weights, values * values), np.dot(weights, weights)]
+
+    def fit(self):
+        # (a, b, residual variance, effective sample count, weighted mean t, weighted spread of t)
+        w, wt, wtt, wy, wty, wyy, ww = self.sums
+        if w <= 0 or ww <= 0:
+            return None
+        n = w * w / ww
+        mean_t = wt / w
+        mean_y = wy / w
+        sxx = wtt - w * mean_t * mean_t
+        if n <= 2 or sxx <= 1e-9 * w:
+            return None
+        sxy = wty - w * mean_t * mean_y
+        syy = wyy - w * mean_y * mean_y
+        b = sxy / sxx
+        a = mean_y - b * mean_t
+        variance = max(syy - b * sxy, 0) / w * n / (n - 2)
+        return float(a), float(b), float(variance), float(n), float(mean_t), float(sxx / w)
+
+    def predict(self, t, fit=None):
+        # Value at t and its standard error
+        fit = fit or self.fit()
+        if fit is None:
+            return None, None
+        a, b, variance, n, mean_t, spread = fit
+        return a + b * t, math.sqrt(variance * (1 / n + (t - mean_t) ** 2 / (spread * n)))
+
+
+class LandingPredictor:
+    # Fits the last tau seconds of the descent as straight lines in altitude,
+    # latitude and longitude against time and extrapolates them to the ground
+    def __init__(self, tau=10, ground_altitude=0, min_descent_rate=0.5):
+        self.tau = tau
+        self.ground_altitude = ground_altitude
+        self.min_descent_rate = min_descent_rate
+        self.subscribers = []
+        self.clear()
+
+    def clear(self):
+        self.altitude = DecayingFit(self.tau)
+        self.latitude = DecayingFit(self.tau)
+        self.longitude = DecayingFit(self.tau)
+        # PACKET_COUNT against time, to place the prediction on the Trajectory plot
+        self.packets = DecayingFit(self.tau)
+        self.prediction = None
+
+    def fits(self):
+        return {'altitude': self.altitude, 'latitude': self.latitude, 'longitude': self.longitude, 'packets': self.packets}
+
+    def checkpoint(self):
+        # The running sums are all a restart needs, for Flight_Journal
+        return {name: [fit.latest, fit.sums.tolist()] for name, fit in self.fits().items()}
+
+    def restore(self, state):
+        for name, fit in self.fits().items():
+            fit.latest, sums = state[name]
+            fit.sums = np.array(sums)
+        self.prediction = self.predict()
+
+    def subscribe(self, callback):
+        # callback(prediction) after every batch, prediction is None while not descending
+        self.subscribers.append(callback)
+
+    def update(self, count, columns):
+        # Subscribed to the validator
+        times = columns['TIME_STAMPING']
+        self.packets.add(times, columns['PACKET_COUNT'].astype(np.float64))
+        if 'ALTITUDE' in columns:
+            self.altitude.add(times, columns['ALTITUDE'])
+        if 'GNSS_LATITUDE' in columns and 'GNSS_LONGITUDE' in columns:
+            lat = columns['GNSS_LATITUDE']
+            lon = columns['GNSS_LONGITUDE']
+            # No fix yet is sent as 0, 0
+            fixed = (lat != 0) | (lon != 0)
+            self.latitude.add(times[fixed], lat[fixed])
+            self.longitude.add(times[fixed], lon[fixed])
+        self.prediction = self.predict()
+        for callback in self.subscribers:
+            callback(self.prediction)
+
+    def predict(self):
+        fit = self.altitude.fit()
+        if fit is None:
+            return None
+        altitude, rate = fit[0], fit[1]
+        if -rate < self.min_descent_rate:
+            return None
+        # Relative to the latest altitude sample
+        seconds = max((self.ground_altitude - altitude) / rate, 0.0)
+        sigma_altitude = self.altitude.predict(seconds, fit)[1]
+        sigma_seconds = sigma_altitude / -rate
+
+        lat = lon = radius = None
+        lat_fit = self.latitude.fit()
+        lon_fit = self.longitude.fit()
+        if lat_fit is not None and lon_fit is not None:
+            # The position fits have their own latest sample time
+            lat_t = seconds + self.altitude.latest - self.latitude.latest
+            lon_t = seconds + self.altitude.latest - self.longitude.latest
+            lat, sigma_lat = self.latitude.predict(lat_t, lat_fit)
+            lon, sigma_lon = self.longitude.predict(lon_t, lon_fit)
+            north = METRES_PER_DEGREE
+            east = METRES_PER_DEGREE * math.cos(math.radians(lat))
+            # Spread of the fitted position plus how far the drift carries it within the landing time's error
+            speed = math.hypot(lat_fit[1] * north, lon_fit[1] * east)
+            radius = math.sqrt((sigma_lat * north) ** 2 + (sigma_lon * east) ** 2 + (speed * sigma_seconds) ** 2)
+
+        packet = landing_packet = None
+        packet_fit = self.packets.fit()
+        if packet_fit is not None:
+            packet_t = self.altitude.latest - self.packets.latest
+            packet = self.packets.predict(packet_t, packet_fit)[0]
+            landing_packet = self.packets.predict(packet_t + seconds, packet_fit)[0]
+
+        return Prediction(self.altitude.latest + seconds, seconds, sigma_seconds, lat, lon, radius,
+                          packet, altitude, landing_packet)
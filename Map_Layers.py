@@ -0,0 +1,142 @@
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from kivy.clock import Clock
+from kivy.core.image import Image as CoreImage
+from kivy.garden.mapview import MapLayer, MapSource
+from kivy.graphics import Color, Line
+
+from Tile_Store import TILE_URL, fetch_tile, tms_row
+
+# How long to stay off the network after a tile download fails
+RETRY_AFTER = 30
+
+# Length of the equator in metres, for the size of a map pixel
+EQUATOR = 40075016.686
+
+
+def map_xy(map_source, zoom, lat, lon):
+    # MapSource.get_x and get_y for whole arrays
+    size = 2.0 ** zoom * map_source.dp_tile_size
+    x = (np.clip(lon, -180.0, 180.0) + 180.0) / 360.0 * size
+    lat = np.radians(np.clip(-lat, -90.0, 90.0))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        y = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / np.pi) / 2.0 * size
+    return x, y
+
+
+class CachedMapSource(MapSource):
+    # Tiles come from the MBTiles store first and from the tile server only when
+    # missing; downloaded tiles are kept, so anything seen once works offline
+    def __init__(self, store, url=TILE_URL, offline=False, **kwargs):
+        super().__init__(url=url, cache_key='cansat', **kwargs)
+        self.store = store
+        self.offline = offline
+        self.retry_at = 0.0
+        self.executor = ThreadPoolExecutor(4, thread_name_prefix='MapTiles')
+
+    def fill_tile(self, tile):
+        if tile.state == 'done':
+            return
+        self.executor.submit(self.load_tile, tile)
+
+    def load_tile(self, tile):
+        # mapview numbers rows from the bottom like MBTiles, so tile_y is the tile_row
+        zoom, x, row = tile.zoom, tile.tile_x, tile.tile_y
+        data = self.store.get(zoom, x, row)
+        if data is None and not self.offline and time.monotonic() >= self.retry_at:
+            try:
+                data = fetch_tile(zoom, x, tms_row(zoom, row), self.url)
+                self.store.put(zoom, x, row, data)
+            except OSError:
+                # No connection at the launch field: don't make every tile wait for a timeout
+                self.retry_at = time.monotonic() + RETRY_AFTER
+        if data is None:
+            tile.state = 'done'
+            return
+        image = CoreImage(io.BytesIO(data), ext='png', filename=f"{zoom}.{x}.{row}.png")
+        Clock.schedule_once(lambda dt: self.tile_loaded(tile, image))
+
+    def tile_loaded(self, tile, image):
+        tile.texture = image.texture
+        tile.state = 'need-animation'
+
+
+class GroundTrackLayer(MapLayer):
+    # The whole ground track as one line, with at most one point per screen pixel
+    def __init__(self, store, color=(1, 0.3, 0.2, 0.9), width=1.5, **kwargs):
+        super().__init__(**kwargs)
+        self.store = store
+        self.projected_key = None
+        self.projected = None
+        with self.canvas:
+            Color(*color)
+            self.line = Line(points=[], width=width)
+
+    def project(self, mapview):
+        # Map pixels only change with the zoom or new packets, panning reuses them
+        key = (mapview.zoom, self.store.count)
+        if key != self.projected_key:
+            lat = self.store.window('GNSS_LATITUDE')
+            lon = self.store.window('GNSS_LONGITUDE')
+            # No fix yet is sent as 0, 0
+            valid = np.isfinite(lat) & np.isfinite(lon) & ((lat != 0) | (lon != 0))
+            self.projected = map_xy(mapview.map_source, mapview.zoom, lat[valid], lon[valid])
+            self.projected_key = key
+        return self.projected
+
+    def reposition(self):
+        mapview = self.parent
+        if mapview is None or not len(self.store):
+            self.unload()
+            return
+        x, y = self.project(mapview)
+        if not len(x):
+            return
+        vx, vy = mapview.viewport_pos
+        scale = mapview.scale
+        x = (x - vx) * scale + mapview.x
+        y = (y - vy) * scale + mapview.y
+
+        # A point is kept only when it lands in a different pixel from the one before
+        keep = np.ones(len(x), dtype=bool)
+        keep[1:] = (np.diff(np.floor(x)) != 0) | (np.diff(np.floor(y)) != 0)
+        keep[-1] = True
+        self.line.points = np.column_stack((x[keep], y[keep])).ravel().tolist()
+
+    def unload(self):
+        self.line.points = []
+
+
+class LandingLayer(MapLayer):
+    # Predicted landing point as a cross in a circle as big as its uncertainty
+    def __init__(self, predictor, color=(1, 1, 0, 0.9), width=1.5, **kwargs):
+        super().__init__(**kwargs)
+        self.predictor = predictor
+        with self.canvas:
+            Color(*color)
+            self.circle = Line(width=width)
+            self.cross = Line(width=width)
+
+    def reposition(self):
+        mapview = self.parent
+        prediction = self.predictor.prediction
+        if mapview is None or prediction is None or prediction.lat is None:
+            self.unload()
+            return
+        x, y = map_xy(mapview.map_source, mapview.zoom, np.array([prediction.lat]), np.array([prediction.lon]))
+        vx, vy = mapview.viewport_pos
+        scale = mapview.scale
+        x = (x[0] - vx) * scale + mapview.x
+        y = (y[0] - vy) * scale + mapview.y
+        metres_per_pixel = EQUATOR * np.cos(np.radians(prediction.lat)) / (2.0 ** mapview.zoom * mapview.map_source.dp_tile_size) / scale
+        # Never smaller than the cross, so it stays visible zoomed out
+        radius = max(prediction.radius / metres_per_pixel, 8)
+        self.circle.circle = (x, y, radius)
+        self.cross.points = [x - 6, y - 6, x + 6, y + 6, x, y, x - 6, y + 6, x + 6, y - 6]
+
+    def unload(self):
+        self.circle.points = []
+        self.cross.points = []
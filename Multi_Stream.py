@@ -0,0 +1,159 @@
+import csv
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from Console_Log import console
+from Flight_History import FlightHistory
+from Flight_Metrics import FlightMetrics
+from Landing_Predictor import LandingPredictor
+from Packet_Validator import PacketValidator, verify_checksums
+from Telemetry_Feed import CsvTailer
+from Telemetry_Store import DATA_COLUMNS, VALIDATED_COLUMNS, TelemetryStore, to_array
+
+STREAM_COLORS = ['#1db954', '#ff9f1c', '#2ec4b6', '#e71d36', '#a06cd5', '#ffd166']
+
+DTYPES = dict(DATA_COLUMNS)
+
+
+def parse_columns(header, data, checksums=False):
+    # Runs in a worker process: csv text in, one typed array per column out,
+    # so the UI thread only validates and copies arrays into the store
+    failed = 0
+    if checksums:
+        lines, failed = verify_checksums(data.split(b'\n'))
+        data = b'\n'.join(lines)
+    text_lines = [line.strip() for line in data.decode('utf-8', errors='replace').split('\n')]
+    rows = list(csv.reader(line for line in text_lines if line))
+    columns = {}
+    for index, name in enumerate(header):
+        if name in DTYPES:
+            columns[name] = to_array([fields[index] if index < len(fields) else '' for fields in rows], DTYPES[name])
+    # Counted the way parse_rows keeps them: fields past the header are dropped, so a
+    # stray trailing comma doesn't make the normal packets after it look short
+    named = sum(1 for name in header if name)
+    fields = np.minimum(np.fromiter(map(len, rows), dtype=np.int32, count=len(rows)), named)
+    return len(rows), columns, fields, failed
+
+
+def derive(validator, history=True):
+    # Everything worked out from a stream's validated batches besides its store: the
+    # metrics, the landing fit and, for the graph popup, the whole flight at every zoom
+    metrics = FlightMetrics()
+    predictor = LandingPredictor()
+    validator.subscribe(metrics.update)
+    validator.subscribe(predictor.update)
+    flight = None
+    if history:
+        flight = FlightHistory()
+        validator.subscribe(flight.update)
+    return metrics, predictor, flight
+
+
+def spawn_context():
+    # A spawned process imports the main module again, which brings Kivy up: keep its log
+    # quiet there, and keep it off sys.argv, which only holds the app's options by then
+    os.environ.setdefault('KIVY_NO_CONSOLELOG', '1')
+    os.environ.setdefault('KIVY_NO_ARGS', '1')
+    return multiprocessing.get_context('spawn')
+
+
+def parse_stream_args(specs):
+    # NAME=PATH, or just PATH and the file name without extension is the name
+    streams = {}
+    for spec in specs:
+        name, _, path = spec.rpartition('=')
+        streams[name or os.path.splitext(os.path.basename(path))[0]] = path
+    return streams
+
+
+class StreamFeed:
+    def __init__(self, streams, capacity=None, workers=None, validation=None):
+        self.names = list(streams)
+        self.tailers = {name: CsvTailer(path) for name, path in streams.items()}
+        for name, tailer in self.tailers.items():
+            tailer.reset_subscribers.append(lambda name=name: self.clear_stream(name))
+        self.stores = {name: TelemetryStore(VALIDATED_COLUMNS) if capacity is None else TelemetryStore(VALIDATED_COLUMNS, capacity)
+                       for name in self.names}
+        # Every stream has its own packet counter, so each gets its own validator
+        validation = validation or {}
+        self.checksums = validation.get('checksums', False)
+        self.add_streams(self.stores, {name: PacketValidator(store, **validation) for name, store in self.stores.items()})
+        # One parse in flight per stream keeps every stream in order; whatever is
+        # appended meanwhile goes into that stream's next parse
+        self.pending = {name: None for name in self.names}
+        workers = workers or min(len(self.names), os.cpu_count() or 1)
+        self.executor = ProcessPoolExecutor(workers, mp_context=spawn_context())
+
+    def add_streams(self, stores, validators):
+        # Shared with the feeds that take their packets from elsewhere: one store and
+        # validator per stream, with everything derived from it subscribed behind
+        self.names = list(stores)
+        self.stores = stores
+        self.validators = validators
+        self.metrics, self.predictors, self.histories = {}, {}, {}
+        for name, validator in validators.items():
+            self.metrics[name], self.predictors[name], self.histories[name] = derive(validator)
+        self.colors = {name: STREAM_COLORS[i % len(STREAM_COLORS)] for i, name in enumerate(self.names)}
+        self.subscribers = []
+        self.selected = None
+
+    def clear_stream(self, name):
+        # The stream's file started again; a parse of the old one still running is dropped
+        self.pending[name] = None
+        for part in (self.stores[name], self.validators[name], self.metrics[name], self.predictors[name], self.histories[name]):
+            part.clear()
+
+    def columns(self, stream='DATA'):
+        header = self.tailers[self.names[0]].read_header() or []
+        return [name for name in header if name]
+
+    def subscribe(self, callback):
+        # callback(name, count, columns) with every packet parsed, after the valid ones are stored
+        self.subscribers.append(callback)
+
+    def select(self, name):
+        # None overlays every stream
+        self.selected = name if name in self.stores else None
+
+    def all_streams(self):
+        return [(name, self.stores[name], self.colors[name]) for name in self.names]
+
+    def visible(self):
+        if self.selected is None:
+            return self.all_streams()
+        return [(self.selected, self.stores[self.selected], self.colors[self.selected])]
+
+    def current(self):
+        name = self.selected or self.names[0]
+        return name, self.stores[name], self.colors[name]
+
+    def poll(self, dt=None):
+        for name, tailer in self.tailers.items():
+            future = self.pending[name]
+            if future is not None:
+                if not future.done():
+                    continue
+                self.pending[name] = None
+                self.publish(name, future)
+
+            lines = tailer.read_new_lines()
+            if lines:
+                self.pending[name] = self.executor.submit(parse_columns, tailer.header, b'\n'.join(lines), self.checksums)
+
+    def publish(self, name, future):
+        try:
+            count, columns, fields, failed = future.result()
+        except Exception as e:
+            console.log(f"Error: {name}: {e}")
+            return
+        self.validators[name].errors['checksum'] += failed
+        if count:
+            self.validators[name].extend_columns(count, columns, fields)
+            for callback in self.subscribers:
+                callback(name, count, columns)
+
+    def stop(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
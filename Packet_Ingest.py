@@ -0,0 +1,178 @@
+import os
+import pty
+import queue
+import select
+import socket
+import threading
+import time
+import tty
+
+from Telemetry_Store import DATA_COLUMNS
+
+DATA_NAMES = [name for name, dtype in DATA_COLUMNS]
+
+
+class SerialReader:
+    def __init__(self, port, baudrate=9600):
+        import serial
+        self.serial = serial.Serial(port, baudrate, timeout=0.1)
+
+    def read(self):
+        return self.serial.read(self.serial.in_waiting or 1)
+
+    def close(self):
+        self.serial.close()
+
+
+class UdpReader:
+    def __init__(self, host, port):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self.sock.settimeout(0.1)
+
+    def read(self):
+        try:
+            data, address = self.sock.recvfrom(65535)
+        except socket.timeout:
+            return b''
+        # A datagram always carries whole packets, close the last line if the sender didn't
+        return data if data.endswith(b'\n') else data + b'\n'
+
+    def close(self):
+        self.sock.close()
+
+
+class PtyLoopback:
+    # Stand-in for the radio: a pseudo-terminal pair where send() writes to the
+    # master end and the ingest thread reads the slave end like a serial port
+    def __init__(self):
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+        self.replaying = False
+
+    def send(self, line):
+        os.write(self.master, line.rstrip('\n').encode('utf-8') + b'\n')
+
+    def read(self):
+        ready, _, _ = select.select([self.slave], [], [], 0.1)
+        if not ready:
+            return b''
+        return os.read(self.slave, 4096)
+
+    def replay(self, path, rate=1.0):
+        def run():
+            with open(path, encoding='utf-8-sig') as f:
+                lines = f.read().splitlines()[1:]
+            while self.replaying:
+                for line in lines:
+                    if not self.replaying:
+                        return
+                    try:
+                        self.send(line)
+                    except OSError:
+                        return
+                    time.sleep(1.0 / rate)
+
+        self.replaying = True
+        threading.Thread(target=run, name='PtyLoopback', daemon=True).start()
+
+    def close(self):
+        self.replaying = False
+        os.close(self.master)
+        os.close(self.slave)
+
+
+class PacketIngest:
+    def __init__(self, reader, columns=DATA_NAMES, maxsize=256):
+        self.reader = reader
+        self.names = columns
+        self.queue = queue.Queue(maxsize)
+        self.subscribers = {'DATA': [], 'ALTITUDE': []}
+        self.latest = {'DATA': None, 'ALTITUDE': None}
+        self.timing = {'DATA': [], 'ALTITUDE': []}
+        self.partial = b''
+        # Runs on the ingest thread with the raw lines of each chunk, see Packet_Validator.check_lines
+        self.line_filter = None
+        self.dropped = 0
+        self.running = False
+        self.thread = None
+
+    def columns(self, stream):
+        if stream == 'ALTITUDE':
+            return ['PACKET_COUNT', 'ALTITUDE']
+        return list(self.names)
+
+    def subscribe(self, stream, callback):
+        self.subscribers[stream].append(callback)
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='PacketIngest', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.running = False
+        self.thread.join(timeout=1)
+        self.thread = None
+        self.reader.close()
+
+    def run(self):
+        while self.running:
+            try:
+                chunk = self.reader.read()
+            except OSError as e:
+                print(f"Error: {e}")
+                break
+            received = time.time()
+            rows = self.split(chunk) if chunk else []
+            if rows:
+                self.put((rows, received, time.time()))
+
+    def split(self, chunk):
+        lines = (self.partial + chunk).split(b'\n')
+        self.partial = lines.pop()
+        if lines and self.line_filter is not None:
+            lines = self.line_filter(lines)
+        rows = []
+        for line in lines:
+            text = line.decode('utf-8', errors='replace').strip()
+            if not text or text.startswith(self.names[0]):
+                continue
+            rows.append(dict(zip(self.names, text.split(','))))
+        return rows
+
+    def put(self, batch):
+        # The radio must never wait on the UI, so when the queue is full the
+        # oldest batch is thrown away to make room for the new one
+        while True:
+            try:
+                self.queue.put_nowait(batch)
+                return
+            except queue.Full:
+                try:
+                    self.dropped += len(self.queue.get_nowait()[0])
+                except queue.Empty:
+                    pass
+
+    def poll(self, dt=None):
+        rows = []
+        timing = []
+        while True:
+            try:
+                batch, received, parsed = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            rows.extend(batch)
+            timing.append((len(batch), received, parsed))
+        if not rows:
+            return
+
+        altitude_rows = [{'PACKET_COUNT': row.get('PACKET_COUNT', ''), 'ALTITUDE': row.get('ALTITUDE', '')} for row in rows]
+        for stream, batch in (('DATA', rows), ('ALTITUDE', altitude_rows)):
+            self.timing[stream] = timing
+            self.latest[stream] = batch[-1]
+            for callback in self.subscribers[stream]:
+                callback(batch)
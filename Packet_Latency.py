@@ -0,0 +1,123 @@
+import collections
+import json
+import time
+
+import numpy as np
+
+# Every latency is measured from the moment a packet reached the ground station,
+# except 'link' which is how old the packet already was then (needs synced clocks)
+STAGES = ['link', 'parsed', 'stored', 'drawn', 'shown']
+
+# Log-spaced bins from 0.1 ms to 100 s, anything outside lands in the end bins
+EDGES = np.logspace(-4, 2, 61)
+
+# Batches kept for the draw and show stages; older ones count as never drawn
+MAX_PENDING = 4096
+
+
+class RollingHistogram:
+    def __init__(self, edges=EDGES, window=60):
+        self.edges = edges
+        self.window = window
+        # One row of counts per second, reused as the window rolls past it
+        self.slots = np.zeros((window, len(edges) + 1), dtype=np.int64)
+        self.seconds = np.full(window, -1, dtype=np.int64)
+        self.total = np.zeros(len(edges) + 1, dtype=np.int64)
+
+    def add(self, values, now):
+        second = int(now)
+        slot = second % self.window
+        if self.seconds[slot] != second:
+            self.slots[slot] = 0
+            self.seconds[slot] = second
+        bins = np.searchsorted(self.edges, values, side='right')
+        counts = np.bincount(bins, minlength=len(self.edges) + 1)
+        self.slots[slot] += counts
+        self.total += counts
+
+    def counts(self, now):
+        recent = self.seconds > int(now) - self.window
+        return self.slots[recent].sum(axis=0)
+
+    def percentile(self, q, counts):
+        n = counts.sum()
+        if not n:
+            return None
+        # Upper edge of the bin holding the q-th sample, so it never under-reports;
+        # samples past the last edge have no upper bound
+        index = int(np.searchsorted(np.cumsum(counts), q / 100 * n))
+        return float(self.edges[index]) if index < len(self.edges) else np.inf
+
+
+class LatencyTracker:
+    def __init__(self, source, window=60, count=0):
+        self.source = source
+        self.histograms = {stage: RollingHistogram(window=window) for stage in STAGES}
+        # (first, end, received) per batch, first and end being store counts and
+        # received the arrival time of each packet in between
+        self.pending = collections.deque(maxlen=MAX_PENDING)
+        # Starts at the store's count, which a resume has already taken past 0
+        self.cursors = {'drawn': count, 'shown': count}
+        self.count = count
+
+    def record(self, count, columns):
+        # Subscribed to the validator, so by now the packets are stored
+        stored = time.time()
+        timing = self.source.timing['DATA']
+        sizes = [size for size, received, parsed in timing]
+        received = np.repeat([received for size, received, parsed in timing], sizes)
+        parsed = np.repeat([parsed for size, received, parsed in timing], sizes)
+        # Rejected packets leave fewer than the source published; they are matched up
+        # from the newest end, and packets held back from an earlier batch count as
+        # received with the oldest of this one
+        received = np.pad(received[-count:], (max(0, count - len(received)), 0), mode='edge')
+        parsed = np.pad(parsed[-count:], (max(0, count - len(parsed)), 0), mode='edge')
+        self.add('link', received - columns['TIME_STAMPING'], stored)
+        self.add('parsed', parsed - received, stored)
+        self.add('stored', stored - received, stored)
+        self.pending.append((self.count, self.count + count, received))
+        self.count += count
+
+    def mark(self, stage, count, first=0):
+        # Called by a widget once the packets from store count first up to count are
+        # on screen; packets it skipped, or an earlier widget already showed, are left out
+        now = time.time()
+        cursor = max(self.cursors[stage], first)
+        # Newest first, so only the batches that arrived since the last mark are visited
+        for first, end, received in reversed(self.pending):
+            if end <= cursor:
+                break
+            if first >= count:
+                continue
+            self.add(stage, now - received[max(first, cursor) - first:min(end, count) - first], now)
+        self.cursors[stage] = max(cursor, count)
+
+    def add(self, stage, values, now):
+        values = values[np.isfinite(values)]
+        if len(values):
+            self.histograms[stage].add(values, now)
+
+    def summary(self, now=None, rolling=True):
+        now = time.time() if now is None else now
+        summary = {}
+        for stage, histogram in self.histograms.items():
+            counts = histogram.counts(now) if rolling else histogram.total
+            summary[stage] = {'packets': int(counts.sum())}
+            for q in (50, 95, 99):
+                summary[stage][f'p{q}'] = histogram.percentile(q, counts)
+        return summary
+
+    def overlay_text(self):
+        lines = ['latency   p50 / p95 ms']
+        for stage, stats in self.summary().items():
+            if stats['packets']:
+                lines.append(f"{stage:<8}{stats['p50'] * 1000:8.1f} / {stats['p95'] * 1000:.1f}")
+        return '\n'.join(lines)
+
+    def dump(self, path):
+        result = {'edges': EDGES.tolist(), 'stages': {}}
+        for stage, stats in self.summary(rolling=False).items():
+            stats['counts'] = self.histograms[stage].total.tolist()
+            result['stages'][stage] = stats
+        with open(path, 'w') as f:
+            json.dump(result, f, indent=2)
@@ -0,0 +1,221 @@
+import numpy as np
+
+from Telemetry_Store import to_array
+
+ERRORS = ['field_count', 'unparsable', 'checksum', 'range', 'duplicate', 'out_of_order']
+
+# Bits of the FLAGS column for packets that were kept but look wrong
+OUT_OF_RANGE = 1
+
+# Anything outside these is physically impossible for the CanSat or its sensors
+RANGES = {
+    'ALTITUDE': (-500, 50000),
+    'VOLTAGE': (0, 50),
+    'PRESSURE': (0, 1200),
+    'GNSS_LATITUDE': (-90, 90),
+    'GNSS_LONGITUDE': (-180, 180),
+    'GNSS_ALTITUDE': (-500, 50000),
+    'GNSS_SATS': (0, 64),
+}
+
+# Packet counts are indexed with one byte each, so a corrupted count can't ask for gigabytes
+MAX_PACKET_COUNT = 10_000_000
+
+HEX_DIGITS = np.full(256, -1, dtype=np.int16)
+for i, c in enumerate(b'0123456789ABCDEF'):
+    HEX_DIGITS[c] = i
+    HEX_DIGITS[bytes([c]).lower()[0]] = i
+
+
+def verify_checksums(lines):
+    # Every line ends in *HH: the XOR of all the bytes before the '*', in hex, as in
+    # NMEA sentences. Returns the good lines without their checksums and how many failed
+    lines = [line for line in lines if line.strip()]
+    if not lines:
+        return [], 0
+    data = b'\n'.join(lines)
+    raw = np.frombuffer(data, dtype=np.uint8)
+    ends = np.append(np.flatnonzero(raw == ord('\n')), len(raw))
+    starts = np.append(0, ends[:-1] + 1)
+    # Lines from Windows end in \r
+    ends = ends - (raw[np.maximum(ends - 1, 0)] == ord('\r'))
+
+    stars = ends - 3
+    ok = stars >= starts
+    at = np.clip(stars, 0, len(raw) - 1)
+    high = HEX_DIGITS[raw[np.clip(at + 1, 0, len(raw) - 1)]]
+    low = HEX_DIGITS[raw[np.clip(at + 2, 0, len(raw) - 1)]]
+    ok &= (raw[at] == ord('*')) & (high >= 0) & (low >= 0)
+
+    # XOR of a line's payload from a running XOR of the whole batch
+    running = np.concatenate(([0], np.bitwise_xor.accumulate(raw)))
+    ok &= (running[at] ^ running[starts]) == high * 16 + low
+
+    good = [data[start:star] for start, star in zip(starts[ok].tolist(), stars[ok].tolist())]
+    return good, len(lines) - len(good)
+
+
+class PacketValidator:
+    # Sits between the source and the store: checks a whole batch with array
+    # operations, drops what can't be trusted and hands the rest to the store
+    # in PACKET_COUNT order, each packet once
+    def __init__(self, store, ranges=RANGES, reject_ranges=False, reorder_window=0, checksums=False):
+        self.store = store
+        self.ranges = ranges
+        self.reject_ranges = reject_ranges
+        # Packets held back so a late one can still go in ahead of them
+        self.reorder_window = reorder_window
+        self.checksums = checksums
+        self.dtypes = {name: array.dtype for name, array in store.arrays.items() if name != 'FLAGS'}
+        self.errors = dict.fromkeys(ERRORS, 0)
+        self.received = 0
+        self.accepted = 0
+        self.fields = 0
+        self.seen = np.zeros(1024, dtype=bool)
+        self.released = -1
+        # TIME_STAMPING of the packet released last
+        self.released_time = -np.inf
+        self.held = None
+        self.subscribers = []
+
+    def subscribe(self, callback):
+        # callback(count, columns) after accepted packets have been stored
+        self.subscribers.append(callback)
+
+    def check_lines(self, lines):
+        # Hooked into the source ahead of parsing when packets carry checksums
+        lines, failed = verify_checksums(lines)
+        self.errors['checksum'] += failed
+        return lines
+
+    def extend(self, rows):
+        # Subscribed to DATA in place of store.extend
+        if not rows:
+            return
+        fields = np.fromiter(map(len, rows), dtype=np.int32, count=len(rows))
+        columns = {name: to_array([row.get(name, '') for row in rows], dtype) for name, dtype in self.dtypes.items()}
+        self.extend_columns(len(rows), columns, fields)
+
+    def extend_columns(self, count, columns, fields=None):
+        if not count:
+            return
+        self.received += count
+        good = np.ones(count, dtype=bool)
+        if fields is not None:
+            # Short packets were cut off on the way; the widest seen so far is the full one
+            self.fields = max(self.fields, int(fields.max()))
+            good = self.reject('field_count', good, fields < self.fields)
+
+        packets = columns['PACKET_COUNT']
+        good = self.reject('unparsable', good, (packets < 0) | (packets > MAX_PACKET_COUNT)
+                           | ~np.isfinite(columns['TIME_STAMPING']))
+
+        out = np.zeros(count, dtype=bool)
+        with np.errstate(invalid='ignore'):
+            for name, (low, high) in self.ranges.items():
+                if name in columns:
+                    out |= (columns[name] < low) | (columns[name] > high)
+        flags = np.zeros(count, dtype=np.int32)
+        if self.reject_ranges:
+            good = self.reject('range', good, out)
+        else:
+            out &= good
+            self.errors['range'] += int(np.count_nonzero(out))
+            flags[out] |= OUT_OF_RANGE
+
+        index = np.flatnonzero(good)
+        order = np.argsort(packets[index], kind='stable')
+        index = index[order]
+        packets = packets[index]
+        # A count at or below one already stored is a repeat or arrived late, unless it is
+        # newer: then the flight software restarted and counts from the start again
+        if np.any((packets <= self.released) & (columns['TIME_STAMPING'][index] > self.released_time)):
+            self.reset()
+        if len(packets) and packets[-1] >= len(self.seen):
+            self.seen = np.concatenate((self.seen, np.zeros(max(len(self.seen), packets[-1] + 1 - len(self.seen)), dtype=bool)))
+
+        repeated = self.seen[packets]
+        repeated[1:] |= packets[1:] == packets[:-1]
+        # The store stays in packet order, so a packet older than the last one stored is dropped
+        late = ~repeated & (packets <= self.released)
+        self.errors['duplicate'] += int(np.count_nonzero(repeated))
+        self.errors['out_of_order'] += int(np.count_nonzero(late))
+        keep = ~(repeated | late)
+        index = index[keep]
+        self.seen[packets[keep]] = True
+
+        batch = {name: values[index] for name, values in columns.items()}
+        batch['FLAGS'] = flags[index]
+        self.release(batch)
+
+    def reject(self, error, good, bad):
+        bad &= good
+        self.errors[error] += int(np.count_nonzero(bad))
+        return good & ~bad
+
+    def release(self, batch):
+        if self.held is not None:
+            batch = {name: np.concatenate((self.held[name], values)) for name, values in batch.items()}
+            order = np.argsort(batch['PACKET_COUNT'], kind='stable')
+            batch = {name: values[order] for name, values in batch.items()}
+        ready = max(0, len(batch['PACKET_COUNT']) - self.reorder_window)
+        if self.reorder_window:
+            self.held = {name: values[ready:] for name, values in batch.items()}
+        if not ready:
+            return
+        batch = {name: values[:ready] for name, values in batch.items()}
+        self.released = int(batch['PACKET_COUNT'][-1])
+        self.released_time = float(batch['TIME_STAMPING'][-1])
+        self.accepted += ready
+        self.store.extend_columns(ready, batch)
+        for callback in self.subscribers:
+            callback(ready, batch)
+
+    def reset(self):
+        self.seen[:] = False
+        self.released = -1
+        self.released_time = -np.inf
+
+    def clear(self):
+        # Forget every packet, for a replay seek or a new file; the error counters keep counting
+        self.reset()
+        self.held = None
+        self.fields = 0
+
+    def checkpoint(self):
+        # Everything but the packets seen, which come back from the stored PACKET_COUNTs, for Flight_Journal
+        held = None if self.held is None else {name: values.tolist() for name, values in self.held.items()}
+        return {'errors': self.errors, 'received': self.received, 'accepted': self.accepted,
+                'fields': self.fields, 'released': self.released, 'released_time': self.released_time, 'held': held}
+
+    def restore(self, state, packets):
+        self.errors = dict(self.errors, **state['errors'])
+        self.received = state['received']
+        self.accepted = state['accepted']
+        self.fields = state['fields']
+        self.released = state['released']
+        self.released_time = state['released_time']
+        if state['held'] is not None:
+            self.held = {name: np.array(values, dtype=self.store.arrays[name].dtype) for name, values in state['held'].items()}
+        if len(packets):
+            self.seen = np.zeros(max(len(self.seen), int(packets.max()) + 1), dtype=bool)
+            self.seen[packets] = True
+
+    def restore_released(self, count, columns):
+        # Packets stored after the checkpoint restore() came from, for Flight_Journal
+        packets = columns['PACKET_COUNT']
+        self.received += count
+        self.accepted += count
+        self.released = int(packets[-1])
+        self.released_time = float(columns['TIME_STAMPING'][-1])
+        if self.held is not None:
+            # Held at the checkpoint, and released since if they are stored now
+            kept = ~np.isin(self.held['PACKET_COUNT'], packets)
+            self.held = {name: values[kept] for name, values in self.held.items()}
+
+    def rejected(self):
+        return sum(count for error, count in self.errors.items() if error != 'range' or self.reject_ranges)
+
+    def summary(self):
+        errors = ', '.join(f"{error} {count}" for error, count in self.errors.items() if count)
+        return f"{self.accepted} packets, {self.rejected()} rejected" + (f" ({errors})" if errors else '')
@@ -0,0 +1,87 @@
+import time
+
+from kivy.clock import Clock
+
+from Frame_Profiler import callback_name
+
+
+class RenderScheduler:
+    def __init__(self, source, max_fps=20):
+        self.source = source
+        self.frame_time = 1.0 / max_fps
+        self.entries = []
+        # (name, callback) to run once in the next frame
+        self.pending = []
+        self.next_frame = 0.0
+        self.overruns = 0
+        self.event = None
+        # A FrameProfiler while profiling, None otherwise
+        self.profiler = None
+
+    def add(self, callback, interval=0, widget=None):
+        # widget is the one that has to be on screen for the callback to run
+        entry = {'callback': callback, 'interval': interval, 'widget': widget, 'last': time.perf_counter()}
+        self.entries.append(entry)
+        return entry
+
+    def once(self, callback, name):
+        # Run in the next frame, so the frame time and the profiler count it too
+        self.pending.append((name, callback))
+
+    def remove(self, entry):
+        if entry in self.entries:
+            self.entries.remove(entry)
+
+    def profile(self, profiler):
+        # None turns profiling off again; the one being replaced reports first
+        if self.profiler is not None:
+            self.profiler.stop()
+        self.profiler = profiler
+
+    def start(self):
+        self.event = Clock.schedule_interval(self.tick, 0)
+
+    def stop(self):
+        if self.event is not None:
+            self.event.cancel()
+            self.event = None
+
+    def tick(self, dt):
+        now = time.perf_counter()
+        if now < self.next_frame:
+            return
+
+        # Read once a frame, so with profiling off each call only costs the test
+        profiler = self.profiler
+        if profiler is None:
+            self.source.poll()
+        else:
+            profiler.start_frame(now)
+            profiler.run(f"{type(self.source).__name__}.poll", self.source.poll)
+        pending, self.pending = self.pending, []
+        for name, callback in pending:
+            if profiler is None:
+                callback()
+            else:
+                profiler.run(name, callback)
+        for entry in list(self.entries):
+            widget = entry['widget']
+            if widget is not None and widget.get_root_window() is None:
+                continue
+            elapsed = now - entry['last']
+            if elapsed < entry['interval']:
+                continue
+            entry['last'] = now
+            if profiler is None:
+                entry['callback'](elapsed)
+            else:
+                profiler.run(callback_name(entry), entry['callback'], elapsed)
+
+        # A frame that overran is not made up for: everything reads the latest
+        # data, so the frames it missed collapse into the next one
+        finished = time.perf_counter()
+        if finished - now > self.frame_time:
+            self.overruns += 1
+        if profiler is not None:
+            profiler.end_frame(finished)
+        self.next_frame = max(now + self.frame_time, finished)
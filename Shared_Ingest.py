@@ -0,0 +1,213 @@
+import atexit
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from Console_Log import console
+from Flight_Recorder import CLOSE, FLUSH, FlightRecorder, session_path
+from Multi_Stream import StreamFeed, spawn_context
+from Packet_Validator import ERRORS, PacketValidator
+from Telemetry_Store import DEFAULT_CAPACITY, VALIDATED_COLUMNS, TelemetryStore
+
+# Published by the ingest process after every poll, count last; writing is set
+# before each write, to the count the store will have once it is done, and
+# cleared to the count at which the source last started a new file
+HEADER = ['count', 'writing', 'cleared', 'received', 'accepted', 'recorded'] + ERRORS
+
+# How often the ingest process polls its source, in seconds
+POLL_INTERVAL = 0.005
+
+
+def shared_size(columns, ring):
+    return len(HEADER) * 8 + sum(2 * ring * np.dtype(dtype).itemsize for name, dtype in columns)
+
+
+class SharedStore(TelemetryStore):
+    # A TelemetryStore whose arrays are laid out in a shared memory block, after a
+    # small header: the ingest process writes it and the UI process maps the same
+    # pages. The ring is headroom packets longer than the window handed out, so
+    # the writer can run that far ahead of the count the reader last took without
+    # touching anything the reader can see
+    def __init__(self, shared, columns=VALIDATED_COLUMNS, capacity=DEFAULT_CAPACITY, headroom=0):
+        self.columns = [name for name, dtype in columns]
+        self.capacity = capacity + headroom
+        self.visible = capacity
+        self.header = np.ndarray(len(HEADER), dtype=np.int64, buffer=shared.buf)
+        self.arrays = {}
+        offset = self.header.nbytes
+        for name, dtype in columns:
+            self.arrays[name] = np.ndarray(2 * self.capacity, dtype=dtype, buffer=shared.buf, offset=offset)
+            offset += self.arrays[name].nbytes
+        self.count = 0
+        self.start = 0
+
+    def __len__(self):
+        return min(self.count - self.start, self.visible)
+
+    def extend_columns(self, count, columns):
+        self.header[1] = self.count + count
+        super().extend_columns(count, columns)
+
+
+def run_ingest(args, shared_name, capacity, headroom, validation, record_path, commands):
+    # The ingest process: the source, the validator and the recorder all run here
+    from Source_Options import make_source
+    from Telemetry_Feed import TelemetryFeed
+
+    shared = shared_memory.SharedMemory(shared_name)
+    store = SharedStore(shared, VALIDATED_COLUMNS, capacity, headroom)
+    feed = make_source(args) or TelemetryFeed()
+    validator = PacketValidator(store, **validation)
+    if validator.checksums:
+        feed.line_filter = validator.check_lines
+    feed.subscribe('DATA', validator.extend)
+    if hasattr(feed, 'subscribe_reset'):
+        feed.subscribe_reset('DATA', lambda: clear(store, validator))
+    recorder = FlightRecorder(record_path)
+    feed.subscribe('DATA', recorder.record)
+    try:
+        while True:
+            feed.poll()
+            store.header[3:] = [validator.received, validator.accepted, recorder.recorded] + [validator.errors[error] for error in ERRORS]
+            # Only once every packet it covers has been written
+            store.header[0] = store.count
+            if not commands.empty():
+                command = commands.get()
+                if command == CLOSE:
+                    break
+                if command == FLUSH:
+                    recorder.flush()
+            time.sleep(POLL_INTERVAL)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        recorder.close()
+        if hasattr(feed, 'stop'):
+            feed.stop()
+
+
+def clear(store, validator):
+    # The window clears its own side when it sees cleared move
+    validator.clear()
+    store.clear()
+    store.header[2] = store.count
+
+
+class IngestRecorder:
+    # What LiveUpdateApp uses of a FlightRecorder, for the one in the ingest process
+    export_columns = FlightRecorder.export_columns
+
+    def __init__(self, commands, path, export_path=None):
+        self.commands = commands
+        self.path = path
+        self.export_path = export_path
+        self.recorded = 0
+
+    def flush(self):
+        self.commands.put(FLUSH)
+
+    def close(self):
+        # The ingest process closes its own when it stops
+        pass
+
+
+class SharedFeed(StreamFeed):
+    # Looks like a StreamFeed to CombinedApp, but the one source is read, validated
+    # and recorded by an ingest process on another core, straight into a
+    # SharedStore. poll() only takes the count that process published: the graphs
+    # and the derived metrics read the packets where they were written, nothing is
+    # copied or pickled on the way
+    def __init__(self, args, name='cansat', capacity=DEFAULT_CAPACITY, headroom=None, validation=None):
+        # A quarter of the window, 9000 packets by default, 9 s at 1000 Hz
+        headroom = capacity // 4 if headroom is None else headroom
+        self.shared = shared_memory.SharedMemory(create=True, size=shared_size(VALIDATED_COLUMNS, capacity + headroom))
+        store = SharedStore(self.shared, VALIDATED_COLUMNS, capacity, headroom)
+        # The local validator only holds the counters the ingest process publishes
+        self.add_streams({name: store}, {name: PacketValidator(store)})
+        context = spawn_context()
+        self.commands = context.SimpleQueue()
+        # Named here, so the window can say where the packets are being recorded
+        self.recorder = IngestRecorder(self.commands, session_path())
+        self.process = context.Process(target=run_ingest, name='Ingest', daemon=True,
+                                       args=(args, self.shared.name, capacity, headroom, validation or {}, self.recorder.path, self.commands))
+        self.process.start()
+        self.exited = False
+        self.overrun = False
+        self.cleared = 0
+        # Ctrl+C ends the app without on_stop; the block still has to go
+        atexit.register(self.stop)
+
+    def columns(self, stream='DATA'):
+        return [name for name, dtype in VALIDATED_COLUMNS if name != 'FLAGS']
+
+    def poll(self, dt=None):
+        name = self.names[0]
+        store = self.stores[name]
+        validator = self.validators[name]
+        # One read of the header; count comes first, so every packet it covers is already there
+        header = dict(zip(HEADER, store.header.tolist()))
+        validator.received = header['received']
+        validator.accepted = header['accepted']
+        validator.errors.update((error, header[error]) for error in ERRORS)
+        self.recorder.recorded = header['recorded']
+
+        if header['cleared'] > self.cleared:
+            # The ingest process started on a new file: the old flight goes, here as well
+            self.cleared = header['cleared']
+            store.start = max(store.start, self.cleared)
+            for part in (self.metrics[name], self.predictors[name], self.histories[name]):
+                part.clear()
+
+        if header['count'] > store.count:
+            # Packets of the old file not handed on yet are skipped
+            first = max(store.count, self.cleared)
+            store.count = header['count']
+            # Read-only views of what was just written, at most the last window of it
+            columns = {column: store.since(column, first) for column in store.columns}
+            start = store.count - len(columns['PACKET_COUNT'])
+            # The ingest process kept writing meanwhile: if it got more than the headroom
+            # ahead, it has come round to the oldest of these rows again, so they go
+            overwritten = self.overwritten(store)
+            if overwritten > start:
+                columns = {column: view[overwritten - start:] for column, view in columns.items()}
+                start = overwritten
+            count = len(columns['PACKET_COUNT'])
+            lost = store.count - count - first
+            if count:
+                for callback in validator.subscribers:
+                    callback(count, columns)
+                for callback in self.subscribers:
+                    callback(name, count, columns)
+                # Rows written over while they were being read were handed on damaged
+                lost += max(0, self.overwritten(store) - start)
+            self.report_overrun(validator, lost)
+        elif not self.exited and not self.process.is_alive():
+            self.exited = True
+            console.log(f"Error: the ingest process stopped (exit code {self.process.exitcode})")
+
+    def overwritten(self, store):
+        # Rows below this may already hold newer packets, counting the batch being
+        # written; the graphs stop showing them
+        overwritten = min(int(store.header[1]) - store.capacity, store.count)
+        store.start = max(store.start, overwritten)
+        return overwritten
+
+    def report_overrun(self, validator, lost):
+        if lost:
+            validator.errors['overrun'] = validator.errors.get('overrun', 0) + lost
+            # Once per overrun, the counter on the Live Update tab keeps the total
+            if not self.overrun:
+                console.log(f"Error: the window fell behind the ingest process, {lost} packets lost")
+        self.overrun = bool(lost)
+
+    def stop(self):
+        if self.process.is_alive():
+            self.commands.put(CLOSE)
+            self.process.join(timeout=5)
+            if self.process.is_alive():
+                self.process.terminate()
+        try:
+            self.shared.unlink()
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,58 @@
+from Telemetry_Feed import DATA_FILE
+
+
+def add_source_arguments(parser):
+    # Where packets come from, shared by Finalapp.py and the headless Telemetry_Server.py
+    parser.add_argument('--serial', metavar='PORT', help='read packets from a serial port instead of DATA.csv')
+    parser.add_argument('--baud', type=int, default=9600)
+    parser.add_argument('--udp', metavar='HOST:PORT', help='read packets from a UDP socket instead of DATA.csv')
+    parser.add_argument('--loopback', action='store_true', help='replay DATA.csv through a pseudo-terminal, no radio needed')
+    parser.add_argument('--loopback-rate', type=float, default=1.0, help='packets per second for --loopback')
+    parser.add_argument('--replay', metavar='FILE', help='play back a recorded flight (DATA.csv or a recorded Telemetry data csv) with pause, speed and seek controls')
+    parser.add_argument('--replay-speed', type=float, default=1.0, help='starting speed for --replay, 1 to 100')
+    parser.add_argument('--streams', nargs='+', metavar='NAME=PATH', help='watch several DATA.csv files, one per CanSat, each parsed in its own process')
+    parser.add_argument('--checksums', action='store_true', help='packets end in *HH, the XOR of the bytes before the *; drop those that fail')
+    parser.add_argument('--reject-out-of-range', action='store_true', help='drop packets with impossible values instead of only flagging them')
+    parser.add_argument('--reorder-window', type=int, default=0, metavar='N', help='hold back the newest N packets so late ones can still be put in order')
+
+
+def make_source(args):
+    from Packet_Ingest import PacketIngest, SerialReader, UdpReader, PtyLoopback
+
+    if args.replay:
+        from Flight_Replay import FlightReplay
+        return FlightReplay(args.replay, args.replay_speed)
+    if args.serial:
+        reader = SerialReader(args.serial, args.baud)
+    elif args.udp:
+        host, port = args.udp.rsplit(':', 1)
+        reader = UdpReader(host, int(port))
+    elif args.loopback:
+        reader = PtyLoopback()
+        reader.replay(DATA_FILE, args.loopback_rate)
+    else:
+        return None
+    ingest = PacketIngest(reader)
+    ingest.start()
+    return ingest
+
+
+def make_validation(args):
+    return {'reject_ranges': args.reject_out_of_range, 'reorder_window': args.reorder_window, 'checksums': args.checksums}
+
+
+def make_streams(args):
+    if getattr(args, 'connect', None):
+        from Telemetry_Server import RemoteFeed
+        host, port = args.connect.rsplit(':', 1)
+        return RemoteFeed(host, int(port))
+    if args.streams:
+        from Multi_Stream import StreamFeed, parse_stream_args
+        return StreamFeed(parse_stream_args(args.streams), validation=make_validation(args))
+    if getattr(args, 'ingest_process', False):
+        if args.replay:
+            print("Error: a replay is controlled from the window, --ingest-process is ignored")
+            return None
+        from Shared_Ingest import SharedFeed
+        return SharedFeed(args, validation=make_validation(args))
+    return None
@@ -0,0 +1,44 @@
+import time
+from contextlib import contextmanager
+
+
+class StartupTimer:
+    def __init__(self):
+        self.enabled = False
+        self.start = time.perf_counter()
+        self.last = self.start
+        self.marks = []
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self.marks.append((name, now - self.last, now - self.start))
+        self.last = now
+
+    @contextmanager
+    def section(self, name):
+        begin = time.perf_counter()
+        yield
+        now = time.perf_counter()
+        self.marks.append((name, now - begin, now - self.start))
+        self.last = now
+
+    def names(self):
+        return [name for name, took, at in self.marks]
+
+    def line(self, mark):
+        name, took, at = mark
+        return f"{name:<24}{took * 1000:10.1f} ms   at {at * 1000:10.1f} ms"
+
+    def report(self):
+        if self.enabled:
+            print("Startup timing")
+            for mark in self.marks:
+                print(self.line(mark))
+
+    def report_last(self):
+        if self.enabled and self.marks:
+            print(self.line(self.marks[-1]))
+
+
+# Created on the first import, which Finalapp does before anything else
+startup_timer = StartupTimer()
@@ -0,0 +1,143 @@
+import csv
+import os
+import time
+
+DATA_FILE = 'DATA.csv'
+ALTITUDE_FILE = 'Altitude.csv'
+
+# Bytes before the read offset compared on every read, to notice a rewrite
+TAIL = 64
+
+
+class CsvTailer:
+    def __init__(self, path):
+        self.path = path
+        self.header = None
+        self.offset = 0
+        self.inode = None
+        self.mtime = None
+        self.partial = b''
+        self.tail = b''
+        # callback() when the file is found replaced or rewritten, before its lines are read again
+        self.reset_subscribers = []
+
+    def reset(self):
+        self.header = None
+        self.offset = 0
+        self.partial = b''
+        self.tail = b''
+        for callback in self.reset_subscribers:
+            callback()
+
+    def check_rotation(self):
+        # A new inode means the file was replaced, a smaller size means it was
+        # truncated; either way start again from the header.
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        if self.inode is not None and (stat.st_ino != self.inode or stat.st_size < self.offset):
+            self.reset()
+        self.inode = stat.st_ino
+        self.mtime = stat.st_mtime
+        return stat.st_size
+
+    def read_header(self):
+        if self.header is not None:
+            return self.header
+        if self.check_rotation() is None:
+            return None
+        with open(self.path, 'rb') as f:
+            line = f.readline()
+        if not line.endswith(b'\n'):
+            return None
+        self.offset = len(line)
+        self.partial = b''
+        self.tail = line[-TAIL:]
+        self.header = self.parse_header(line)
+        return self.header
+
+    def parse_header(self, line):
+        text = line.decode('utf-8').lstrip('\ufeff').strip()
+        return [name.strip() for name in next(csv.reader([text]))]
+
+    def read_new_lines(self):
+        # Raw bytes of the complete lines appended since the last call, header taken off
+        mtime = self.mtime
+        size = self.check_rotation()
+        if size is None or (size == self.offset and self.mtime == mtime):
+            return []
+
+        with open(self.path, 'rb') as f:
+            # Truncated and written again past the offset keeps the inode and the size
+            # check misses it, but the bytes just before the offset won't match any more
+            f.seek(self.offset - len(self.tail))
+            if f.read(len(self.tail)) != self.tail:
+                self.reset()
+                f.seek(0)
+            chunk = f.read(size - self.offset)
+        self.offset += len(chunk)
+        self.tail = (self.tail + chunk)[-TAIL:]
+
+        lines = (self.partial + chunk).split(b'\n')
+        # The last element is either empty or a line the writer hasn't finished yet
+        self.partial = lines.pop()
+
+        if self.header is None and lines:
+            self.header = self.parse_header(lines.pop(0))
+        return lines
+
+    def read_new_rows(self):
+        # The header may only be read along with the first lines
+        lines = self.read_new_lines()
+        return parse_rows(self.header, lines)
+
+
+def parse_rows(header, lines):
+    rows = []
+    text_lines = [line.decode('utf-8', errors='replace').strip() for line in lines]
+    for fields in csv.reader(line for line in text_lines if line):
+        # Trailing commas in DATA.csv produce an unnamed empty column, skip it
+        rows.append({name: value for name, value in zip(header, fields) if name})
+    return rows
+
+
+class TelemetryFeed:
+    def __init__(self, sources=None):
+        if sources is None:
+            sources = {'DATA': DATA_FILE, 'ALTITUDE': ALTITUDE_FILE}
+        self.tailers = {name: CsvTailer(path) for name, path in sources.items()}
+        self.subscribers = {name: [] for name in sources}
+        self.latest = {name: None for name in sources}
+        # (rows, received, parsed) for each batch in the last publish of a stream
+        self.timing = {name: [] for name in sources}
+        self.started = time.time()
+        # Called with each stream's raw lines before they are parsed, see Packet_Validator.check_lines
+        self.line_filter = None
+
+    def columns(self, stream):
+        header = self.tailers[stream].read_header() or []
+        return [name for name in header if name]
+
+    def subscribe(self, stream, callback):
+        self.subscribers[stream].append(callback)
+
+    def subscribe_reset(self, stream, callback):
+        # callback() when a stream's file starts again, so what came from the old one can go
+        self.tailers[stream].reset_subscribers.append(callback)
+
+    def poll(self, dt=None):
+        for name, tailer in self.tailers.items():
+            lines = tailer.read_new_lines()
+            if lines and self.line_filter is not None and name == 'DATA':
+                lines = self.line_filter(lines)
+            rows = parse_rows(tailer.header, lines)
+            if not rows:
+                continue
+            # The file doesn't say when each line was appended, the last write is the
+            # closest there is; it is late for rows written earlier in the same poll.
+            # Rows already in the file at startup count as received at startup
+            self.timing[name] = [(len(rows), max(tailer.mtime, self.started), time.time())]
+            self.latest[name] = rows[-1]
+            for callback in self.subscribers[name]:
+                callback(rows)
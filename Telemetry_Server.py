@@ -0,0 +1,323 @@
+import argparse
+import json
+import queue
+import socket
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from Multi_Stream import StreamFeed, derive
+from Packet_Validator import PacketValidator
+from Source_Options import add_source_arguments, make_source, make_streams, make_validation
+from Telemetry_Feed import TelemetryFeed
+from Telemetry_Store import VALIDATED_COLUMNS, TelemetryStore
+
+DEFAULT_PORT = 8765
+
+# Frames waiting for a viewer before it counts as stuck and is dropped; it gets
+# a fresh snapshot when it reconnects
+MAX_QUEUED = 256
+
+LENGTH = struct.Struct('>I')
+
+# Every frame is [4 byte length][zlib of: JSON header line, then the column arrays
+# back to back]. A batch carries only the packets validated since the last one;
+# integer columns are sent as differences from the packet before, which compress
+# to almost nothing for PACKET_COUNT, GNSS_TIME and FSW_STATE
+
+
+def encode(header, columns=None):
+    blobs = []
+    if columns is not None:
+        header['columns'] = []
+        for name, values in columns.items():
+            values = np.ascontiguousarray(values).astype(values.dtype.newbyteorder('<'))
+            delta = bool(np.issubdtype(values.dtype, np.integer))
+            if delta and len(values):
+                # Integer differences wrap around and back, so this is exact for any value
+                values = np.diff(values, prepend=values.dtype.type(0))
+            header['columns'].append([name, values.dtype.str, delta])
+            blobs.append(values.tobytes())
+    payload = zlib.compress(json.dumps(header).encode('utf-8') + b'\n' + b''.join(blobs), 1)
+    return LENGTH.pack(len(payload)) + payload
+
+
+def decode(payload):
+    payload = zlib.decompress(payload)
+    line, _, blob = payload.partition(b'\n')
+    header = json.loads(line)
+    columns = {}
+    offset = 0
+    for name, dtype, delta in header.get('columns', []):
+        dtype = np.dtype(dtype)
+        size = header['count'] * dtype.itemsize
+        values = np.frombuffer(blob, dtype=dtype, count=header['count'], offset=offset)
+        offset += size
+        columns[name] = np.cumsum(values, dtype=dtype) if delta else values
+    return header, columns
+
+
+def read_frame(sock):
+    length = LENGTH.unpack(read_exactly(sock, LENGTH.size))[0]
+    return decode(read_exactly(sock, length))
+
+
+def read_exactly(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError('server closed the connection')
+        data += chunk
+    return bytes(data)
+
+
+class Viewer:
+    # One connected laptop: frames are encoded once for everyone and queued here,
+    # its own thread does the (possibly slow) sending
+    def __init__(self, sock, address):
+        self.sock = sock
+        self.address = address
+        self.queue = queue.Queue(MAX_QUEUED)
+        self.alive = True
+        threading.Thread(target=self.run, name=f'Viewer {address[0]}:{address[1]}', daemon=True).start()
+
+    def send(self, frame):
+        try:
+            self.queue.put_nowait(frame)
+        except queue.Full:
+            print(f"Error: viewer {self.address[0]} is not keeping up, disconnecting it")
+            self.close()
+
+    def run(self):
+        while self.alive:
+            frame = self.queue.get()
+            if frame is None:
+                break
+            try:
+                self.sock.sendall(frame)
+            except OSError:
+                break
+        self.close()
+
+    def close(self):
+        if self.alive:
+            self.alive = False
+            try:
+                self.queue.put_nowait(None)
+            except queue.Full:
+                pass
+            self.sock.close()
+
+
+class TelemetryServer:
+    # Ingest, validation, storage and derived metrics with no UI; every validated
+    # batch goes out to all connected viewers
+    def __init__(self, feed, host='0.0.0.0', port=DEFAULT_PORT, name='cansat', validation=None):
+        self.viewers = []
+        self.joining = queue.SimpleQueue()
+        if isinstance(feed, StreamFeed):
+            self.streams = feed
+            self.feed = feed
+        else:
+            # A single source is served as one stream under name
+            store = TelemetryStore(VALIDATED_COLUMNS)
+            self.streams = None
+            self.feed = feed
+            self.names = [name]
+            self.stores = {name: store}
+            self.validators = {name: PacketValidator(store, **(validation or {}))}
+            if self.validators[name].checksums:
+                feed.line_filter = self.validators[name].check_lines
+            feed.subscribe('DATA', self.validators[name].extend)
+            # No graph popup here, so no history
+            metrics, predictor, history = derive(self.validators[name], history=False)
+            self.metrics = {name: metrics}
+            self.predictors = {name: predictor}
+            if hasattr(feed, 'subscribe_reset'):
+                feed.subscribe_reset('DATA', lambda: self.clear_stream(name))
+        if self.streams is not None:
+            self.names = self.streams.names
+            self.stores = self.streams.stores
+            self.validators = self.streams.validators
+            self.metrics = self.streams.metrics
+            self.predictors = self.streams.predictors
+        for stream, validator in self.validators.items():
+            validator.subscribe(lambda count, columns, stream=stream: self.broadcast(stream, count, columns))
+
+        self.listener = socket.create_server((host, port))
+        self.address = self.listener.getsockname()
+        self.running = False
+
+    def clear_stream(self, name):
+        # A new DATA.csv is a new flight; viewers see its counts start again as a restart
+        for part in (self.stores[name], self.validators[name], self.metrics[name], self.predictors[name]):
+            part.clear()
+
+    def hello(self):
+        return encode({'type': 'hello', 'streams': self.names})
+
+    def accept(self):
+        while self.running:
+            try:
+                sock, address = self.listener.accept()
+            except OSError:
+                break
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            viewer = Viewer(sock, address)
+            viewer.send(self.hello())
+            # The snapshot is sent from the poll loop so no batch can slip in between
+            self.joining.put(viewer)
+            print(f"Viewer connected from {address[0]}:{address[1]}")
+
+    def batch(self, stream, count, columns):
+        validator = self.validators[stream]
+        header = {'type': 'batch', 'stream': stream, 'count': count,
+                  'accepted': validator.accepted, 'errors': validator.errors}
+        return encode(header, columns)
+
+    def broadcast(self, stream, count, columns):
+        if not self.viewers:
+            return
+        frame = self.batch(stream, count, columns)
+        for viewer in self.viewers:
+            viewer.send(frame)
+
+    def admit(self):
+        while True:
+            try:
+                viewer = self.joining.get_nowait()
+            except queue.Empty:
+                break
+            # Everything still in the store, then it follows the live batches
+            for stream, store in self.stores.items():
+                if len(store):
+                    viewer.send(self.batch(stream, len(store), {name: np.array(store.window(name)) for name in store.columns}))
+            self.viewers.append(viewer)
+
+    def status(self):
+        parts = []
+        for stream in self.names:
+            metrics = self.metrics[stream]
+            prediction = self.predictors[stream].prediction
+            text = f"{stream}: {self.validators[stream].summary()}"
+            if metrics.descent_rate is not None:
+                text += f", descent {metrics.descent_rate:.1f} m/s"
+            if prediction is not None:
+                text += f", landing in {prediction.seconds:.0f} s"
+            parts.append(text)
+        return f"{len(self.viewers)} viewers | " + ' | '.join(parts)
+
+    def serve(self, rate=20, status_interval=5):
+        self.running = True
+        threading.Thread(target=self.accept, name='TelemetryServer', daemon=True).start()
+        print(f"Serving telemetry on {self.address[0]}:{self.address[1]}")
+        next_status = time.monotonic() + status_interval
+        try:
+            while self.running:
+                self.admit()
+                self.feed.poll()
+                self.viewers = [viewer for viewer in self.viewers if viewer.alive]
+                if time.monotonic() >= next_status:
+                    print(self.status())
+                    next_status += status_interval
+                time.sleep(1.0 / rate)
+        finally:
+            self.stop()
+
+    def stop(self):
+        self.running = False
+        self.listener.close()
+        for viewer in self.viewers:
+            viewer.close()
+        if hasattr(self.feed, 'stop'):
+            self.feed.stop()
+
+
+class RemoteFeed(StreamFeed):
+    # The client side: looks like a StreamFeed to CombinedApp, but the packets
+    # come already validated from a TelemetryServer
+    def __init__(self, host, port=DEFAULT_PORT, timeout=5):
+        self.host = host
+        self.port = port
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        header, columns = read_frame(self.sock)
+        self.sock.settimeout(None)
+        stores = {name: TelemetryStore(VALIDATED_COLUMNS) for name in header['streams']}
+        # The local validators only drop what a reconnect sends twice; their
+        # counters are replaced by the server's
+        self.add_streams(stores, {name: PacketValidator(store) for name, store in stores.items()})
+        self.received = queue.SimpleQueue()
+        self.running = True
+        threading.Thread(target=self.run, name='RemoteFeed', daemon=True).start()
+
+    def columns(self, stream='DATA'):
+        return [name for name, dtype in VALIDATED_COLUMNS if name != 'FLAGS']
+
+    def run(self):
+        while self.running:
+            try:
+                header, columns = read_frame(self.sock)
+            except (OSError, ValueError, zlib.error) as e:
+                if not self.running:
+                    break
+                print(f"Error: lost {self.host}:{self.port}: {e}")
+                self.reconnect()
+                continue
+            if header.get('type') == 'batch' and header['stream'] in self.stores:
+                self.received.put((header, columns))
+
+    def reconnect(self):
+        self.sock.close()
+        while self.running:
+            time.sleep(2)
+            try:
+                self.sock = socket.create_connection((self.host, self.port), timeout=5)
+                read_frame(self.sock)
+                self.sock.settimeout(None)
+                print(f"Reconnected to {self.host}:{self.port}")
+                return
+            except OSError:
+                pass
+
+    def poll(self, dt=None):
+        while True:
+            try:
+                header, columns = self.received.get_nowait()
+            except queue.Empty:
+                break
+            name = header['stream']
+            count = header['count']
+            validator = self.validators[name]
+            validator.extend_columns(count, columns)
+            validator.accepted = header['accepted']
+            validator.errors.update(header['errors'])
+            for callback in self.subscribers:
+                callback(name, count, columns)
+
+    def stop(self):
+        self.running = False
+        self.sock.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Headless CanSat ground station serving telemetry to Finalapp.py --connect viewers')
+    add_source_arguments(parser)
+    parser.add_argument('--host', default='0.0.0.0', help='address to listen on, 127.0.0.1 for this machine only')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--name', default='cansat', help='stream name viewers see for a single source')
+    parser.add_argument('--rate', type=float, default=20, help='polls of the source per second')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    feed = make_streams(args) or make_source(args) or TelemetryFeed()
+    server = TelemetryServer(feed, args.host, args.port, args.name, make_validation(args))
+    try:
+        server.serve(args.rate)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,117 @@
+import numpy as np
+
+DATA_COLUMNS = [
+    ('TIME_STAMPING', np.float64),
+    ('PACKET_COUNT', np.int32),
+    ('ALTITUDE', np.float64),
+    ('TEMPERATURE', np.float64),
+    ('VOLTAGE', np.float64),
+    ('GNSS_TIME', np.int32),
+    ('PRESSURE', np.float64),
+    ('GNSS_LATITUDE', np.float64),
+    ('GNSS_LONGITUDE', np.float64),
+    ('GNSS_ALTITUDE', np.float64),
+    ('GNSS_SATS', np.int32),
+    ('ACCELEROMETER_DATA', np.float64),
+    ('GYROSPIN_RATE', np.float64),
+    ('FSW_STATE', np.int32),
+    ('MAGNETOMETER_DATA', np.float64),
+    ('HALLSENSOR_DATA', np.float64),
+    ('VIBRATION_DATA', np.float64),
+    ('CMD_ECHO', np.float64),
+]
+
+ALTITUDE_COLUMNS = [
+    ('PACKET_COUNT', np.int32),
+    ('ALTITUDE', np.float64),
+]
+
+# DATA_COLUMNS plus what Packet_Validator found wrong with each packet it kept
+VALIDATED_COLUMNS = DATA_COLUMNS + [('FLAGS', np.int32)]
+
+# One hour of packets at 10 Hz
+DEFAULT_CAPACITY = 36000
+
+# Integer columns can't hold NaN, missing or unparsable values are stored as this
+MISSING_INT = -1
+
+
+def to_array(values, dtype):
+    try:
+        array = np.array(values, dtype=np.float64)
+    except ValueError:
+        array = np.array([to_float(value) for value in values], dtype=np.float64)
+    if np.issubdtype(dtype, np.integer):
+        array = np.where(np.isnan(array), MISSING_INT, array)
+    return array.astype(dtype)
+
+
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+class TelemetryStore:
+    def __init__(self, columns=DATA_COLUMNS, capacity=DEFAULT_CAPACITY):
+        self.columns = [name for name, dtype in columns]
+        self.capacity = capacity
+        # Each row is written twice, at i and i + capacity, so the last n rows are
+        # always one contiguous slice and windows can be handed out as views
+        self.arrays = {name: np.zeros(2 * capacity, dtype=dtype) for name, dtype in columns}
+        self.count = 0
+        self.start = 0
+
+    def __len__(self):
+        return min(self.count - self.start, self.capacity)
+
+    def clear(self):
+        # count keeps growing, so anything keyed on it still sees a change
+        self.start = self.count
+
+    def extend(self, rows):
+        if not rows:
+            return
+        # Rows that would be overwritten straight away aren't converted at all
+        kept = rows[max(0, len(rows) - self.capacity):]
+        columns = {name: to_array([row.get(name, '') for row in kept], array.dtype) for name, array in self.arrays.items()}
+        self.extend_columns(len(rows), columns)
+
+    def extend_columns(self, count, columns):
+        # columns holds the last min(count, capacity) values of each column, already typed
+        if not count:
+            return
+        kept = min(count, self.capacity)
+        start = (self.count + count - kept) % self.capacity
+        for name, array in self.arrays.items():
+            values = columns.get(name)
+            if values is None:
+                values = to_array([''] * kept, array.dtype)
+            self.write(array, start, values[len(values) - kept:])
+        self.count += count
+
+    def write(self, array, start, values):
+        first = min(len(values), self.capacity - start)
+        array[start:start + first] = values[:first]
+        array[start + self.capacity:start + self.capacity + first] = values[:first]
+        rest = len(values) - first
+        if rest:
+            array[:rest] = values[first:]
+            array[self.capacity:self.capacity + rest] = values[first:]
+
+    def window(self, name, n=None):
+        size = len(self)
+        n = size if n is None else min(n, size)
+        end = self.count % self.capacity + self.capacity
+        view = self.arrays[name][end - n:end]
+        view.flags.writeable = False
+        return view
+
+    def since(self, name, count):
+        return self.window(name, self.count - count)
+
+    def latest(self, name):
+        if not len(self):
+            return None
+        return self.arrays[name][(self.count - 1) % self.capacity]
@@ -0,0 +1,140 @@
+import argparse
+import math
+import sqlite3
+import threading
+import time
+import urllib.request
+
+TILE_FILE = 'tiles.mbtiles'
+TILE_URL = 'https://tile.openstreetmap.org/{z}/{x}/{y}.png'
+USER_AGENT = 'CANSAT-coding ground station'
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT)',
+    'CREATE TABLE IF NOT EXISTS tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB,'
+    ' PRIMARY KEY (zoom_level, tile_column, tile_row))',
+]
+
+
+def tile_xy(lat, lon, zoom):
+    # Slippy map tile holding the point; the row counts down from the top like the tile URLs
+    n = 2 ** zoom
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tms_row(zoom, y):
+    # MBTiles rows count up from the bottom, the same way mapview numbers tile_y
+    return 2 ** zoom - 1 - y
+
+
+def fetch_tile(zoom, x, y, url=TILE_URL, timeout=5):
+    request = urllib.request.Request(url.format(z=zoom, x=x, y=y), headers={'User-Agent': USER_AGENT})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.read()
+
+
+class TileStore:
+    # A single MBTiles (SQLite) file. mapview loads tiles on a pool of threads and
+    # sqlite connections can't be shared between threads, so each gets its own
+    def __init__(self, path=TILE_FILE):
+        self.path = path
+        self.local = threading.local()
+        db = self.connect()
+        for statement in SCHEMA:
+            db.execute(statement)
+        db.executemany('INSERT OR IGNORE INTO metadata VALUES (?, ?)',
+                       [('name', 'CanSat launch area'), ('format', 'png'), ('type', 'baselayer'),
+                        ('minzoom', '0'), ('maxzoom', '19')])
+        db.commit()
+
+    def connect(self):
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10)
+            # Readers don't wait for the downloader threads writing new tiles
+            db.execute('PRAGMA journal_mode=WAL')
+            self.local.db = db
+        return db
+
+    def get(self, zoom, x, row):
+        found = self.connect().execute(
+            'SELECT tile_data FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?', (zoom, x, row)).fetchone()
+        return bytes(found[0]) if found else None
+
+    def has(self, zoom, x, row):
+        return self.connect().execute(
+            'SELECT 1 FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?', (zoom, x, row)).fetchone() is not None
+
+    def put(self, zoom, x, row, data):
+        db = self.connect()
+        db.execute('INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?)', (zoom, x, row, sqlite3.Binary(data)))
+        db.commit()
+
+    def set_metadata(self, **values):
+        db = self.connect()
+        db.executemany('INSERT OR REPLACE INTO metadata VALUES (?, ?)', [(name, str(value)) for name, value in values.items()])
+        db.commit()
+
+    def count(self):
+        return self.connect().execute('SELECT COUNT(*) FROM tiles').fetchone()[0]
+
+
+def area(lat, lon, radius_km):
+    # Half the height and width in degrees of the square of radius_km around a point
+    dlat = radius_km / 111.32
+    return dlat, dlat / max(math.cos(math.radians(lat)), 0.01)
+
+
+def seed_tiles(lat, lon, radius_km, zooms):
+    # Every tile touching the square around the launch site
+    dlat, dlon = area(lat, lon, radius_km)
+    for zoom in zooms:
+        x1, y1 = tile_xy(lat + dlat, lon - dlon, zoom)
+        x2, y2 = tile_xy(lat - dlat, lon + dlon, zoom)
+        for x in range(x1, x2 + 1):
+            for y in range(y1, y2 + 1):
+                yield zoom, x, y
+
+
+def seed(store, lat, lon, radius_km, min_zoom, max_zoom, url=TILE_URL, max_tiles=5000, delay=0.1):
+    tiles = list(seed_tiles(lat, lon, radius_km, range(min_zoom, max_zoom + 1)))
+    if len(tiles) > max_tiles:
+        print(f"Error: {len(tiles)} tiles needed, more than --max-tiles {max_tiles}. Use a smaller radius or zoom.")
+        return 0
+
+    fetched = 0
+    for zoom, x, y in tiles:
+        row = tms_row(zoom, y)
+        if store.has(zoom, x, row):
+            continue
+        try:
+            store.put(zoom, x, row, fetch_tile(zoom, x, y, url))
+        except OSError as e:
+            print(f"Error: tile {zoom}/{x}/{y}: {e}")
+            continue
+        fetched += 1
+        if fetched % 100 == 0:
+            print(f"{fetched} tiles downloaded")
+        # Tile servers ask for bulk downloads to be spread out
+        time.sleep(delay)
+
+    dlat, dlon = area(lat, lon, radius_km)
+    store.set_metadata(minzoom=min_zoom, maxzoom=max_zoom, center=f"{lon},{lat},{min_zoom}",
+                       bounds=f"{lon - dlon},{lat - dlat},{lon + dlon},{lat + dlat}")
+    print(f"{fetched} tiles downloaded, {store.count()} in '{store.path}'")
+    return fetched
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Download map tiles around the launch site for offline use')
+    parser.add_argument('lat', type=float)
+    parser.add_argument('lon', type=float)
+    parser.add_argument('--radius-km', type=float, default=5)
+    parser.add_argument('--zoom', type=int, nargs=2, default=[10, 16], metavar=('MIN', 'MAX'))
+    parser.add_argument('--tiles', default=TILE_FILE, help='MBTiles file to fill')
+    parser.add_argument('--url', default=TILE_URL)
+    parser.add_argument('--max-tiles', type=int, default=5000)
+    args = parser.parse_args()
+    seed(TileStore(args.tiles), args.lat, args.lon, args.radius_km, args.zoom[0], args.zoom[1], args.url, args.max_tiles)